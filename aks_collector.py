@@ -0,0 +1,124 @@
+import argparse
+import json
+import os
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from azure_client import ArmClient, ResourceGraphClient, flatten_properties
+from base import FileCombiner, AKSReporter, AKSVersionProcessor, AggressiveAKSUpgradeStrategy
+from report_cache import SnapshotCache
+
+
+# same list scripts/aks_report.sh walks
+subscription_list = ["AU-INNOVATION-SUB001", "AU-PREPROD-SUB001", "AU-PROD-SUB001", "AU-SHARED-SUB001",
+                     "ilt-ppd-001", "mex-ppd-001", "pet-dev-002", "pet-tst-sub", "policy-ppd-001", "timeline",
+                     "sec-prd-001", "UK-PROD-SUB001", "US-PROD-SUB001", "pet-dev-001"]
+
+
+class InMemoryCombiner(FileCombiner):
+
+    def __init__(self, current_versions: dict, upgrades: dict) -> None:
+        super().__init__()
+        self.current_versions = current_versions
+        self.upgrades = upgrades
+
+    def _read_current(self) -> dict:
+        return self.current_versions
+
+    def _read_upgrades(self) -> dict:
+        return self.upgrades
+
+
+class AKSInventoryCollector:
+
+    def __init__(self,
+                 subscriptions: list = subscription_list,
+                 max_workers: int = 8,
+                 persist_folder: str = None,
+                 arm_client: ArmClient = None,
+                 graph_client: ResourceGraphClient = None) -> None:
+        self.subscriptions = subscriptions
+        self.max_workers = max_workers
+        self.persist_folder = persist_folder
+        self.arm_client = arm_client or ArmClient(max_workers=max_workers)
+        self.graph_client = graph_client or ResourceGraphClient()
+        self.subscription_ids = dict()
+
+    def _list_clusters(self, subscription: str) -> list:
+        clusters = self.arm_client.get_paged(
+            f"/subscriptions/{self.subscription_ids.get(subscription, subscription)}/providers/Microsoft.ContainerService/managedClusters",
+            params={"api-version": "2023-08-01"})
+        # same projection as the az aks list --query in aks_report.sh
+        return [{"Name": cluster["name"],
+                 "ResourceId": cluster["id"],
+                 "k8sversion": cluster["properties"]["kubernetesVersion"],
+                 "Location": cluster["location"],
+                 "NodePools": [{"Name": pool["name"], "Version": pool.get("currentOrchestratorVersion")}
+                               for pool in cluster["properties"].get("agentPoolProfiles") or []]}
+                for cluster in clusters]
+
+    def _get_versions(self, location: str, subscription: str) -> dict:
+        return flatten_properties(self.arm_client.get(
+            f"/subscriptions/{self.subscription_ids.get(subscription, subscription)}/providers/Microsoft.ContainerService/locations/{location}/orchestrators",
+            params={"api-version": "2019-08-01", "resource-type": "managedClusters"}))
+
+    def _persist(self, filename: str, data):
+        with open(os.path.join(self.persist_folder, filename), "w") as f:
+            json.dump(data, f)
+
+    def collect(self) -> InMemoryCombiner:
+        self.subscription_ids = self.graph_client.subscription_ids(
+            self.subscriptions)
+        current_versions = dict()
+        upgrades = dict()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            cluster_futures = {executor.submit(self._list_clusters, subscription): subscription
+                               for subscription in self.subscriptions}
+            # a region is queried once, as soon as the first cluster in it shows up
+            region_futures = dict()
+            for future in as_completed(cluster_futures):
+                subscription = cluster_futures[future]
+                current_versions[subscription] = future.result()
+                for cluster in current_versions[subscription]:
+                    if cluster["Location"] not in region_futures:
+                        region_futures[cluster["Location"]] = executor.submit(
+                            self._get_versions, cluster["Location"], subscription)
+
+            for location, future in region_futures.items():
+                upgrades[location] = future.result()
+
+        if self.persist_folder:
+            for subscription, clusters in current_versions.items():
+                self._persist(f"sub_{subscription}.json", clusters)
+            for location, versions in upgrades.items():
+                self._persist(f"loc_{location}.json", versions)
+
+        # keep the subscription order of the input list
+        current_versions = {subscription: current_versions[subscription]
+                            for subscription in self.subscriptions}
+        return InMemoryCombiner(current_versions, upgrades)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(
+        description="Collect the AKS inventory and write the version report")
+    parser.add_argument("--subscriptions", nargs="+",
+                        default=subscription_list)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--persist", metavar="FOLDER", default=None,
+                        help="also write the raw sub_*.json/loc_*.json files to FOLDER")
+    parser.add_argument("--incremental", action="store_true",
+                        help="reuse results for unchanged subscriptions and regions from files/.report_cache")
+    args = parser.parse_args()
+
+    collector = AKSInventoryCollector(subscriptions=args.subscriptions,
+                                      max_workers=args.workers,
+                                      persist_folder=args.persist)
+    combined = collector.collect()
+
+    reporter = AKSReporter(combined, AKSVersionProcessor())
+    reporter.make_report(upgrade_strategy=AggressiveAKSUpgradeStrategy(),
+                         cache=SnapshotCache() if args.incremental else None)
+    reporter.output_xlsx()
+
+    print("Done")
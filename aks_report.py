@@ -1,19 +1,52 @@
-from base import JsonCombiner, AKSReporter, AKSVersionProcessor, AggressiveAKSUpgradeStrategy
-
-
-combined = JsonCombiner(folder_current='files', glob_current="sub_*.json",
-                        folder_upgrades="files/", glob_upgrades="loc_*.json")
-
-processor = AKSVersionProcessor()
-
-reporter = AKSReporter(combined, processor)
-reporter.make_report(upgrade_strategy=AggressiveAKSUpgradeStrategy())
+import argparse
+import os
 
-
-# with open('files/report.json', "w") as f:
-
-#     json.dump(reporter.report, f)
-
-reporter.output_xlsx()
+import instrumentation
+from base import JsonCombiner, AKSReporter, AKSVersionProcessor, AggressiveAKSUpgradeStrategy
+from instrumentation import timer
+from report_cache import SnapshotCache
+from report_output import output_backends
+
+
+parser = argparse.ArgumentParser()
+parser.add_argument("--incremental", action="store_true",
+                    help="reuse results for unchanged sub_*/loc_* files from files/.report_cache")
+parser.add_argument("--metrics", action="store_true",
+                    help="time every stage and Azure call, write files/metrics.json and files/metrics.prom")
+parser.add_argument("--backend", choices=list(output_backends), default=os.getenv("REPORT_BACKEND", "xlsx"),
+                    help="output format, defaults to $REPORT_BACKEND or xlsx")
+parser.add_argument("--streaming", action="store_true",
+                    help="write report.xlsx row by row in constant memory instead of through DataFrames, "
+                    "the other backends always do")
+parser.add_argument("--profile", metavar="FILE", default=os.getenv("REPORT_PROFILE"),
+                    help="run under cProfile and write the stats to FILE, defaults to $REPORT_PROFILE")
+args = parser.parse_args()
+
+if args.metrics:
+    instrumentation.enable()
+
+with instrumentation.profile(args.profile):
+    with timer("stage.load_inputs"):
+        combined = JsonCombiner(folder_current='files', glob_current="sub_*.json",
+                                folder_upgrades="files/", glob_upgrades="loc_*.json")
+
+    processor = AKSVersionProcessor()
+
+    reporter = AKSReporter(combined, processor)
+    with timer("stage.make_report"):
+        reporter.make_report(upgrade_strategy=AggressiveAKSUpgradeStrategy(),
+                             cache=SnapshotCache() if args.incremental else None)
+
+    # with open('files/report.json', "w") as f:
+
+    #     json.dump(reporter.report, f)
+
+    with timer("stage.output"):
+        if args.backend == "xlsx":
+            reporter.output_xlsx(streaming=args.streaming)
+        else:
+            reporter.output(args.backend, "files/report")
+
+instrumentation.metrics.export()
 
 print("Done")
@@ -0,0 +1,266 @@
+import json
+import os
+import queue
+import random
+import shlex
+import subprocess
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+
+import requests
+from requests.adapters import HTTPAdapter
+
+from instrumentation import retry, timer
+from logger import get_logger
+
+
+logger = get_logger(name=__name__)
+
+# overridable so the clients can be pointed at scripts/azure_stub_server.py
+MANAGEMENT_URL = os.getenv("AZURE_MANAGEMENT_URL", "https://management.azure.com")
+MANAGEMENT_RESOURCE = "https://management.azure.com/"
+RESOURCE_GRAPH_API_VERSION = "2021-03-01"
+
+
+class AzureRequestError(Exception):
+    pass
+
+
+class ThrottledError(AzureRequestError):
+
+    def __init__(self, message: str, retry_after: float = None) -> None:
+        super().__init__(message)
+        # seconds ARM asked us to wait, None when it did not say
+        self.retry_after = retry_after
+
+
+def _retry_after(r: requests.Response):
+    try:
+        return float(r.headers.get("Retry-After"))
+    except (TypeError, ValueError):
+        return None
+
+
+def _raise_for_status(r: requests.Response):
+    if r.status_code == 429:
+        raise ThrottledError(f"{r.request.method} {r.url} throttled: {r.text}",
+                             retry_after=_retry_after(r))
+    if not r.ok:
+        raise AzureRequestError(
+            f"{r.request.method} {r.url} failed with {r.status_code}: {r.text}")
+
+
+def az_cli(command: str):
+    # az.cli runs the CLI in-process on shared state, which is not safe to call
+    # from several threads; a subprocess per call is
+    with timer("az.cli") as timing:
+        proc = subprocess.run(["az", *shlex.split(command), "--output", "json"],
+                              capture_output=True, text=True)
+        timing.add_bytes(len(proc.stdout))
+    if proc.returncode != 0:
+        return proc.returncode, None, proc.stderr
+    return proc.returncode, json.loads(proc.stdout) if proc.stdout.strip() else None, proc.stderr
+
+
+def flatten_properties(item: dict) -> dict:
+    # the az CLI lifts "properties" to the top level, keep the same shape
+    flat = {k: v for k, v in item.items() if k != "properties"}
+    flat.update(item.get("properties") or {})
+    return flat
+
+
+class TokenProvider:
+
+    def __init__(self, refresh_margin: int = 300) -> None:
+        self.refresh_margin = refresh_margin
+        self._tokens = dict()
+        self._lock = threading.Lock()
+
+    def get_token(self, tenant: str = None, resource: str = MANAGEMENT_RESOURCE) -> str:
+        with self._lock:
+            token, expires_on = self._tokens.get((tenant, resource), (None, 0))
+            if expires_on - time.time() < self.refresh_margin:
+                token, expires_on = self._fetch(tenant, resource)
+                self._tokens[(tenant, resource)] = (token, expires_on)
+            return token
+
+    def _fetch(self, tenant: str, resource: str):
+        command = f"account get-access-token --resource {resource}"
+        if tenant:
+            command += f" --tenant {tenant}"
+        exit_code, result_dict, logs = az_cli(command)
+        if exit_code != 0:
+            raise AzureRequestError(f"Failed to get access token: {logs}")
+
+        if result_dict.get("expires_on"):
+            expires_on = int(result_dict["expires_on"])
+        else:
+            # older CLIs only return a local time string
+            expires_on = datetime.strptime(
+                result_dict["expiresOn"], "%Y-%m-%d %H:%M:%S.%f").timestamp()
+        return result_dict["accessToken"], expires_on
+
+
+# shared by every client in the process, one token per tenant and audience
+token_provider = TokenProvider()
+
+
+class ArmClient:
+
+    def __init__(self,
+                 tokens: TokenProvider = token_provider,
+                 tenant: str = os.getenv("TENANT_ID"),
+                 endpoint: str = MANAGEMENT_URL,
+                 max_workers: int = 8) -> None:
+        self.tokens = tokens
+        self.tenant = tenant
+        self.endpoint = endpoint
+        self.max_workers = max_workers
+        # one keep-alive pool shared by every thread using the client
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=max_workers))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=max_workers))
+
+    def get(self, path: str, params: dict = None) -> dict:
+        url = path if path.startswith("http") else f"{self.endpoint}{path}"
+        headers = {"Authorization": f"Bearer {self.tokens.get_token(self.tenant)}"}
+        with timer("arm.get") as timing:
+            r = self.session.get(url, params=params, headers=headers)
+            timing.add_bytes(len(r.content))
+            _raise_for_status(r)
+        return r.json()
+
+    def get_paged(self, path: str, params: dict = None):
+        page = self.get(path, params)
+        while True:
+            yield from page.get("value", [])
+            next_link = page.get("nextLink")
+            if not next_link:
+                break
+            page = self.get(next_link)
+
+
+class ResourceGraphClient:
+
+    def __init__(self,
+                 tokens: TokenProvider = token_provider,
+                 tenant: str = os.getenv("TENANT_ID"),
+                 endpoint: str = MANAGEMENT_URL,
+                 page_size: int = 1000,
+                 batch_size: int = 5,
+                 max_workers: int = 4,
+                 retries: int = 5,
+                 backoff: float = 1.0) -> None:
+        self.tokens = tokens
+        self.tenant = tenant
+        self.url = f"{endpoint}/providers/Microsoft.ResourceGraph/resources?api-version={RESOURCE_GRAPH_API_VERSION}"
+        self.page_size = page_size
+        self.batch_size = batch_size
+        self.max_workers = max_workers
+        self.retries = retries
+        self.backoff = backoff
+        self.session = requests.Session()
+        self.session.mount("https://", HTTPAdapter(pool_maxsize=max_workers))
+        self.session.mount("http://", HTTPAdapter(pool_maxsize=max_workers))
+
+    def _post(self, body: dict) -> dict:
+        # the per-user quota is shared by every batch and query running at once,
+        # a throttled page is retried on its own instead of failing the query
+        for attempt in range(self.retries + 1):
+            headers = {"Authorization": f"Bearer {self.tokens.get_token(self.tenant)}"}
+            try:
+                with timer("graph.query") as timing:
+                    r = self.session.post(self.url, json=body, headers=headers)
+                    timing.add_bytes(len(r.content))
+                    _raise_for_status(r)
+                return r.json()
+            except ThrottledError as e:
+                if attempt == self.retries:
+                    raise
+                delay = self.backoff * 2 ** attempt
+                delay += random.uniform(0, delay / 2)
+                if e.retry_after is not None:
+                    delay = max(delay, e.retry_after)
+                logger.warning(f"Resource Graph throttled, retrying in {delay:.1f}s")
+                retry("graph.query")
+                time.sleep(delay)
+
+    def pages(self, query: str, subscriptions: list = None):
+        body = {"query": query,
+                "options": {"$top": self.page_size, "resultFormat": "objectArray"}}
+        if subscriptions:
+            body["subscriptions"] = list(subscriptions)
+
+        while True:
+            page = self._post(body)
+            yield page.get("data", [])
+
+            skip_token = page.get("$skipToken")
+            if not skip_token:
+                break
+            body["options"]["$skipToken"] = skip_token
+
+    def query(self, query: str, subscriptions: list = None):
+        # without subscriptions the query runs against everything the token can see
+        if not subscriptions:
+            for rows in self.pages(query):
+                yield from rows
+            return
+
+        subscriptions = list(subscriptions)
+        batches = [subscriptions[i:i + self.batch_size]
+                   for i in range(0, len(subscriptions), self.batch_size)]
+        if len(batches) == 1:
+            for rows in self.pages(query, batches[0]):
+                yield from rows
+            return
+
+        # pages are handed over through a bounded queue so at most a few
+        # pages per worker are held in memory at any time
+        pages = queue.Queue(maxsize=2 * self.max_workers)
+        stop = threading.Event()
+        done = object()
+
+        def put(item):
+            while not stop.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return
+                except queue.Full:
+                    continue
+
+        def run_batch(batch):
+            try:
+                for rows in self.pages(query, batch):
+                    if stop.is_set():
+                        return
+                    put(rows)
+            except Exception as e:
+                put(e)
+            finally:
+                put(done)
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            for batch in batches:
+                executor.submit(run_batch, batch)
+            try:
+                pending = len(batches)
+                while pending:
+                    item = pages.get()
+                    if item is done:
+                        pending -= 1
+                    elif isinstance(item, Exception):
+                        raise item
+                    else:
+                        yield from item
+            finally:
+                stop.set()
+
+    def subscription_ids(self, names) -> dict:
+        names = set(names)
+        query = "ResourceContainers | where type == 'microsoft.resources/subscriptions' | project name, subscriptionId"
+        return {row["name"]: row["subscriptionId"]
+                for row in self.query(query)
+                if row["name"] in names or row["subscriptionId"] in names}
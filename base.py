@@ -2,8 +2,19 @@ from abc import ABC, abstractmethod
 import os
 import json
 import glob
+import threading
 import pandas as pd
 from collections import OrderedDict
+from collections.abc import Mapping
+from upgrade_graph import compile_upgrade_graph, parse_version
+from report_output import get_backend
+from report_cache import SnapshotCache, bytes_digest, content_digest
+from json_ingest import read_json_file, read_json_files
+from instrumentation import timer
+
+
+# bumped when the cached per-cluster fields change meaning, so old snapshots miss
+snapshot_format = 3
 
 
 class DirectoryNotExist(Exception):
@@ -17,13 +28,71 @@ class ReportNotGenerated(Exception):
 
 
 def versiontuple(v):
-    return tuple(map(int, (v.split("."))))
+    return parse_version(v)
+
+
+def version_columns(versions: pd.Series) -> pd.DataFrame:
+    parts = versions.str.extract(
+        r"^v?(\d+)\.(\d+)(?:\.(\d+))?").astype(float)
+    parts.columns = ["major", "minor", "patch"]
+    parts["patch"] = parts["patch"].fillna(0)
+    parts["key"] = parts["major"] * 1_000_000 + \
+        parts["minor"] * 1_000 + parts["patch"]
+    return parts
+
+
+def glob_key(filename: str, pattern: str) -> str:
+    # the part of the file name the "*" of the glob matched: sub_*.json -> sub_<key>.json
+    name = os.path.basename(filename)
+    prefix, _, suffix = os.path.basename(pattern).partition("*")
+    if not any(c in prefix + suffix for c in "*?[") and name.startswith(prefix) and name.endswith(suffix):
+        return name[len(prefix):len(name) - len(suffix)]
+    return os.path.splitext(name)[0]
+
+
+class LazyJsonFiles(Mapping):
+
+    def __init__(self, filenames: dict, max_workers: int = 8) -> None:
+        self.filenames = filenames
+        self.max_workers = max_workers
+        self.digests = dict()
+        self._data = dict()
+        self._lock = threading.Lock()
+
+    def _store(self, key, raw: bytes, data):
+        self.digests[key] = bytes_digest(raw)
+        self._data[key] = data
+
+    def __getitem__(self, key):
+        with self._lock:
+            if key not in self._data:
+                self._store(key, *read_json_file(self.filenames[key]))
+            return self._data[key]
+
+    def __iter__(self):
+        return iter(self.filenames)
+
+    def __len__(self):
+        return len(self.filenames)
+
+    def load_all(self):
+        keys = {filename: key for key, filename in self.filenames.items()
+                if key not in self._data}
+        with self._lock:
+            for filename, raw, data in read_json_files(keys, self.max_workers):
+                self._store(keys[filename], raw, data)
+        return self
+
+    def digest(self, key) -> str:
+        self[key]
+        return self.digests[key]
 
 
 class FileCombiner(ABC):
 
-    current_versions = dict()
-    upgrades = dict()
+    def __init__(self) -> None:
+        self.current_versions = dict()
+        self.upgrades = dict()
 
     @abstractmethod
     def _read_current(self) -> dict:
@@ -33,6 +102,12 @@ class FileCombiner(ABC):
     def _read_upgrades(self) -> dict:
         pass
 
+    def current_digest(self, subscription: str) -> str:
+        return content_digest(self.current_versions[subscription])
+
+    def upgrade_digest(self, location: str) -> str:
+        return content_digest(self.upgrades[location])
+
 
 class JsonCombiner(FileCombiner):
 
@@ -40,40 +115,45 @@ class JsonCombiner(FileCombiner):
                  folder_current: str = "",
                  glob_current: str = "",
                  folder_upgrades: str = "",
-                 glob_upgrades: str = "") -> None:
+                 glob_upgrades: str = "",
+                 max_workers: int = 8,
+                 subscriptions: list = None) -> None:
 
         super().__init__()
         self.folder_current = folder_current
         self.glob_current = glob_current
         self.folder_upgrades = folder_upgrades
         self.glob_upgrades = glob_upgrades
+        self.max_workers = max_workers
+        self.subscriptions = subscriptions
         self.current_versions = self._read_current()
         self.upgrades = self._read_upgrades()
 
-    def _read_current(self) -> dict:
-
-        if not os.path.exists(self.folder_current):
+    def _index(self, folder: str, pattern: str) -> dict:
+        if not os.path.exists(folder):
             raise DirectoryNotExist(
-                f"Path {self.folder_current} does not exist")
+                f"Path {folder} does not exist")
 
-        for filename in glob.glob(os.path.join(self.folder_current, self.glob_current)):
-            with open(filename) as f:
-                # no time spend on slicing, hardcoded for now
-                self.current_versions[filename[10:-5]] = json.load(f)
+        return {glob_key(filename, pattern): filename
+                for filename in sorted(glob.glob(os.path.join(folder, pattern)))}
 
-        return self.current_versions
+    def _read_current(self) -> LazyJsonFiles:
+        filenames = self._index(self.folder_current, self.glob_current)
+        if self.subscriptions is not None:
+            filenames = {subscription: filename for subscription, filename in filenames.items()
+                         if subscription in self.subscriptions}
+        # every subscription file is needed for the report, read them up front in parallel
+        return LazyJsonFiles(filenames, self.max_workers).load_all()
 
-    def _read_upgrades(self) -> dict:
+    def _read_upgrades(self) -> LazyJsonFiles:
+        # region files are only read once a cluster in that region asks for them
+        return LazyJsonFiles(self._index(self.folder_upgrades, self.glob_upgrades), self.max_workers)
 
-        if not os.path.exists(self.folder_upgrades):
-            raise DirectoryNotExist(
-                f"Path {self.folder_upgrades} does not exist")
+    def current_digest(self, subscription: str) -> str:
+        return self.current_versions.digest(subscription)
 
-        for filename in glob.glob(os.path.join(self.folder_upgrades, self.glob_upgrades)):
-            with open(filename) as f:
-                # no time spend on slicing, hardcoded for now
-                self.upgrades[filename[10:-5]] = json.load(f)
-        return self.upgrades
+    def upgrade_digest(self, location: str) -> str:
+        return self.upgrades.digest(location)
 
 
 class UpgradeStrategy(ABC):
@@ -87,35 +167,47 @@ class AKSUpgradeStrategy(UpgradeStrategy):
     def get_upgrade_path(self, current_version, upgrades, is_outdated: bool):
         pass
 
+    def is_latest(self, current_version, upgrades, is_outdated: bool) -> bool:
+        return compile_upgrade_graph(upgrades).is_latest(current_version["k8sversion"], is_outdated)
 
-class AggressiveAKSUpgradeStrategy(AKSUpgradeStrategy):
+
+class GraphAKSUpgradeStrategy(AKSUpgradeStrategy):
+
+    def __init__(self, include_preview: bool = True) -> None:
+        super().__init__()
+        self.include_preview = include_preview
+
+    @abstractmethod
+    def query(self, graph, version, is_outdated: bool):
+        pass
 
     def get_upgrade_path(self, current_version, upgrades, is_outdated: bool):
+        path, version = self.query(compile_upgrade_graph(upgrades),
+                                   current_version["k8sversion"], is_outdated)
         upgrade_path = OrderedDict()
-        version = current_version["k8sversion"]
-        count = 1
-        if is_outdated:
-            version = upgrades["orchestrators"][0]["orchestratorVersion"]
-            upgrade_path[f"Step {count}"] = version
-            count += 1
-        for orchestrator in upgrades["orchestrators"]:
-            if versiontuple(version) < versiontuple(orchestrator["orchestratorVersion"]):
-                version = orchestrator["orchestratorVersion"]
-                upgrade_path[f"Step {count}"] = version
-
-                count += 1
-            if version == orchestrator["orchestratorVersion"]:
-                if not orchestrator["upgrades"]:
-                    # upgrade_path[f"Step {count}"] = "None Available"
-                    break
-                else:
-                    upgrade_path[f"Step {count}"] = orchestrator["upgrades"][-1]["orchestratorVersion"]
-                    version = orchestrator["upgrades"][-1]["orchestratorVersion"]
-                    count += 1
-
+        for count, step in enumerate(path, start=1):
+            upgrade_path[f"Step {count}"] = step
         return upgrade_path, version
 
 
+class AggressiveAKSUpgradeStrategy(GraphAKSUpgradeStrategy):
+
+    def query(self, graph, version, is_outdated: bool):
+        return graph.aggressive(version, is_outdated, self.include_preview)
+
+
+class MinimalHopsAKSUpgradeStrategy(GraphAKSUpgradeStrategy):
+
+    def query(self, graph, version, is_outdated: bool):
+        return graph.minimal_hops(version, is_outdated, self.include_preview)
+
+
+class LatestPatchAKSUpgradeStrategy(GraphAKSUpgradeStrategy):
+
+    def query(self, graph, version, is_outdated: bool):
+        return graph.latest_patch(version, is_outdated, self.include_preview)
+
+
 class VersionProcessor(ABC):
 
     @abstractmethod
@@ -132,19 +224,48 @@ class VersionProcessor(ABC):
 
 class AKSVersionProcessor(VersionProcessor):
 
+    def __init__(self, cache_size: int = 1024) -> None:
+        super().__init__()
+        self.cache_size = cache_size
+        self.cache_hits = 0
+        self.cache_misses = 0
+        self._cache = OrderedDict()
+
     def get_next_upgrades(self, current_version, upgrades, upgrade_strategy: AKSUpgradeStrategy):
+        # clusters in the same region on the same version share one answer
+        key = (current_version.get("Location"),
+               current_version.get("k8sversion"), upgrade_strategy)
+        if key in self._cache:
+            self.cache_hits += 1
+            self._cache.move_to_end(key)
+            return self._cache[key]
+
+        self.cache_misses += 1
+        result = self._get_next_upgrades(
+            current_version, upgrades, upgrade_strategy)
+        self._cache[key] = result
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return result
+
+    def clear_cache(self):
+        self._cache.clear()
+        self.cache_hits = 0
+        self.cache_misses = 0
+
+    def _get_next_upgrades(self, current_version, upgrades, upgrade_strategy: AKSUpgradeStrategy):
         version_outdated = self.is_outdated(current_version, upgrades)
 
         upgrade_path, latest_GA_version = upgrade_strategy.get_upgrade_path(
             current_version, upgrades, is_outdated=version_outdated)
-        is_latest = False
-
-        if len(upgrade_path) <= 1:
-            is_latest = True
+        # from the graph, not the path length: a latest-patch path is never
+        # longer than one step even when there is an upgrade to take
+        is_latest = upgrade_strategy.is_latest(
+            current_version, upgrades, is_outdated=version_outdated)
         return version_outdated, json.dumps(upgrade_path, indent=4), is_latest, latest_GA_version
 
     def is_outdated(self, current_version, upgrades) -> bool:
-        return versiontuple(current_version.get('k8sversion')) < versiontuple(upgrades["orchestrators"][0]["orchestratorVersion"])
+        return compile_upgrade_graph(upgrades).is_outdated(current_version.get('k8sversion'))
 
 
 class Reporter(ABC):
@@ -153,6 +274,7 @@ class Reporter(ABC):
         super().__init__()
         self.combined = combined
         self.report = None
+        self.node_pools = None
         self.version_processor = version_processor
 
     @abstractmethod
@@ -162,11 +284,18 @@ class Reporter(ABC):
 
 class AKSReporter(Reporter):
 
-    def make_report(self, upgrade_strategy):
+    def make_report(self, upgrade_strategy, cache: SnapshotCache = None):
 
         for subscription, clusters in self.combined.current_versions.items():
             if len(clusters) == 0:
                 continue
+            if cache is not None:
+                inputs = self._snapshot_inputs(
+                    subscription, clusters, upgrade_strategy)
+                cached = cache.load("aks", subscription, **inputs)
+                if cached is not None:
+                    clusters[:] = cached
+                    continue
             for current_version in clusters:
                 upgrade = self.combined.upgrades[current_version.get(
                     "Location")]
@@ -177,64 +306,124 @@ class AKSReporter(Reporter):
                     = self.version_processor.get_next_upgrades(
                     current_version, upgrade, upgrade_strategy)
                 current_version["subscription"] = subscription
+            if cache is not None:
+                cache.store("aks", subscription, clusters, **inputs)
         self.report = self.combined.current_versions
-
-    def output_xlsx(self):
+        self.node_pools = self.analyse_node_pools(upgrade_strategy)
+
+    def _snapshot_inputs(self, subscription: str, clusters: list, upgrade_strategy) -> dict:
+        # taken before make_report adds its fields to the cluster dicts
+        return {"format": snapshot_format,
+                "subscription": self.combined.current_digest(subscription),
+                "regions": {location: self.combined.upgrade_digest(location)
+                            for location in sorted({cluster["Location"] for cluster in clusters})},
+                "strategy": f"{type(upgrade_strategy).__name__}{sorted(vars(upgrade_strategy).items())}"}
+
+    def analyse_node_pools(self, upgrade_strategy, max_minor_skew: int = 2) -> pd.DataFrame:
+        pools = pd.DataFrame.from_records(
+            [(subscription, cluster["Name"], cluster["Location"], cluster["k8sversion"],
+              pool["Name"], pool["Version"])
+             for subscription, clusters in self.combined.current_versions.items()
+             for cluster in clusters
+             for pool in cluster.get("NodePools") or []],
+            columns=["Subscription", "AKS_cluster", "Location", "Control Plane Version",
+                     "Node Pool", "Node Pool Version"])
+        if pools.empty:
+            return pools
+
+        pool_version = version_columns(pools["Node Pool Version"])
+        control_version = version_columns(pools["Control Plane Version"])
+        oldest_supported = version_columns(pd.Series(
+            {location: compile_upgrade_graph(self.combined.upgrades[location]).versions[0]
+             for location in pools["Location"].unique()}, dtype=object))["key"]
+
+        pools["Minor Skew"] = (control_version["major"] - pool_version["major"]) * 1_000 + \
+            control_version["minor"] - pool_version["minor"]
+        pools["isBehindControlPlane"] = pool_version["key"] < control_version["key"]
+        pools["isSkewUnsupported"] = pools["Minor Skew"] > max_minor_skew
+        pools["isOutdated"] = pool_version["key"] < pools["Location"].map(
+            oldest_supported)
+
+        # one upgrade path per distinct (region, version), mapped back onto every pool
+        paths = pools[["Location", "Node Pool Version"]
+                      ].dropna().drop_duplicates()
+        upgrades = [self.version_processor.get_next_upgrades(
+            {"Location": location, "k8sversion": version}, self.combined.upgrades[location], upgrade_strategy)
+            for location, version in paths.itertuples(index=False)]
+        paths["Upgrade to Latest"] = [upgrade[1] for upgrade in upgrades]
+        paths["latest_GA_Version"] = [upgrade[3] for upgrade in upgrades]
+        return pools.merge(paths, on=["Location", "Node Pool Version"], how="left")
+
+    def report_upgrades(self):
+        # only the regions the reported clusters live in
+        locations = {cluster["Location"]
+                     for clusters in self.report.values() for cluster in clusters}
+        for location in self.combined.upgrades:
+            if location in locations:
+                yield location, self.combined.upgrades[location]
+
+    version_report_columns = ["AKS_cluster", "Subscription", "Current Version", "isOutdated",
+                              "isLatest", "latest_GA_Version", "Location", "Upgrade to Latest"]
+
+    def version_report_rows(self):
+        for clusters in self.report.values():
+            for cluster in clusters:
+                yield (cluster["Name"], cluster["subscription"], cluster["k8sversion"], cluster["isOutdated"],
+                       cluster["isLatest"], cluster["latestGAVersion"], cluster["Location"],
+                       cluster["nextAvailableUpgrades"])
+
+    def version_report_frame(self) -> pd.DataFrame:
+        # a fleet has a handful of subscriptions, regions and versions across thousands of clusters
+        return pd.DataFrame.from_records(self.version_report_rows(), columns=self.version_report_columns).astype(
+            {"Subscription": "category", "Location": "category", "Current Version": "category",
+             "latest_GA_Version": "category", "isOutdated": bool, "isLatest": bool})
+
+    @staticmethod
+    def region_upgrades_rows(upgrade: dict):
+        for orchestrator in upgrade["orchestrators"]:
+            yield (orchestrator["orchestratorVersion"],
+                   [up["orchestratorVersion"] for up in orchestrator["upgrades"] or []])
+
+    def region_upgrades_frame(self, upgrade: dict) -> pd.DataFrame:
+        return pd.DataFrame.from_records(self.region_upgrades_rows(upgrade),
+                                         columns=["KubernetesVersion", "Upgrades"])
+
+    def output_xlsx(self, streaming: bool = False, path: str = "files/report.xlsx"):
         if not self.report:
             raise ReportNotGenerated(
                 "Generate report dict first by running make_report.")
-        count = 0
-        aks_dict = dict()
-        subscription_dict = dict()
-        current_version_dict = dict()
-        is_outdated_dict = dict()
-        is_latest_dict = dict()
-        location_dict = dict()
-        next_upgrades_dict = dict()
-        latest_GA_dict = dict()
-
-        for _, clusters in self.report.items():
-            if len(clusters) == 0:
-                continue
-            for cluster in clusters:
-                aks_dict[count] = cluster["Name"]
-                subscription_dict[count] = cluster["subscription"]
-                current_version_dict[count] = cluster["k8sversion"]
-                is_outdated_dict[count] = cluster["isOutdated"]
-                is_latest_dict[count] = cluster["isLatest"]
-                location_dict[count] = cluster["Location"]
-                next_upgrades_dict[count] = cluster["nextAvailableUpgrades"]
-                latest_GA_dict[count] = cluster["latestGAVersion"]
-                count += 1
-
-        df = pd.DataFrame({"AKS_cluster": aks_dict,
-                           "Subscription": subscription_dict,
-                           "Current Version": current_version_dict,
-                           "isOutdated": is_outdated_dict,
-                           "isLatest": is_latest_dict,
-                           "latest_GA_Version": latest_GA_dict,
-                           "Location": location_dict,
-                           "Upgrade to Latest": next_upgrades_dict})
+        if streaming:
+            return self.output("xlsx", path)
+
+        df = self.version_report_frame()
         print(df)
 
-        writer = pd.ExcelWriter("files/report.xlsx", engine='xlsxwriter')
-        df.to_excel(writer, sheet_name="version_report", index=False)
-
-        for location, upgrade in self.combined.upgrades.items():
-            count = 0
-            version_dict = dict()
-            upgrades_dict = dict()
-            for orchestrator in upgrade["orchestrators"]:
-                upgrade_version_list = []
-                version_dict[count] = orchestrator["orchestratorVersion"]
-                if orchestrator["upgrades"]:
-                    for up in orchestrator["upgrades"]:
-                        upgrade_version_list.append(up["orchestratorVersion"])
-                upgrades_dict[count] = upgrade_version_list
-                count += 1
-
-            df = pd.DataFrame({"KubernetesVersion": version_dict,
-                               "Upgrades": upgrades_dict})
-            df.to_excel(writer, sheet_name=f"{location}_upgrades", index=False)
-
-        writer.close()
+        with timer("output.xlsx"):
+            writer = pd.ExcelWriter(path, engine='xlsxwriter')
+            df.to_excel(writer, sheet_name="version_report", index=False)
+            if self.node_pools is not None:
+                self.node_pools.to_excel(
+                    writer, sheet_name="node_pools", index=False)
+
+            for location, upgrade in self.report_upgrades():
+                df = self.region_upgrades_frame(upgrade)
+                df.to_excel(
+                    writer, sheet_name=f"{location}_upgrades", index=False)
+
+            writer.close()
+
+    def output(self, backend: str = "xlsx", path: str = "files/report", chunk_size: int = 10_000):
+        if not self.report:
+            raise ReportNotGenerated(
+                "Generate report dict first by running make_report.")
+        # every table is written from row generators, chunk_size rows at a time
+        with timer(f"output.{backend}"), get_backend(backend, path, chunk_size=chunk_size) as writer:
+            count = writer.write_table("version_report", self.version_report_columns, self.version_report_rows(),
+                                       categories=("Subscription", "Location", "Current Version", "latest_GA_Version"))
+            if self.node_pools is not None:
+                writer.write_table("node_pools", list(self.node_pools.columns), self.node_pools.itertuples(index=False),
+                                   categories=("Subscription", "Location", "Control Plane Version", "Node Pool Version"))
+            for location, upgrade in self.report_upgrades():
+                writer.write_table(f"{location}_upgrades", ["KubernetesVersion", "Upgrades"],
+                                   self.region_upgrades_rows(upgrade))
+        print(f"Wrote {count} clusters to {path} as {backend}")
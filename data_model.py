@@ -1,3 +1,4 @@
+import sys
 from dataclasses import dataclass, field
 
 automation_account_map = {
@@ -18,7 +19,13 @@ automation_account_map = {
 }
 
 
-@dataclass(frozen=False)
+def _intern(value):
+    return sys.intern(value) if type(value) is str else value
+
+
+# slots keep the per-resource footprint down when there are 100k of them,
+# kw_only lets the subclasses add required fields after the defaulted ones
+@dataclass(slots=True, kw_only=True)
 class Resource:
     Location: str
     Name: str
@@ -27,11 +34,18 @@ class Resource:
     ResourceGroup: str
     Subscription: str
     Id: str
-    alerts: field(default_factory=list)
-    alerts_count: int
+    alerts: list = field(default_factory=list)
+    alerts_count: int = 0
+
+    def __post_init__(self):
+        # a few hundred distinct values repeated across every resource
+        self.Location = _intern(self.Location)
+        self.Type = _intern(self.Type)
+        self.ResourceGroup = _intern(self.ResourceGroup)
+        self.Subscription = _intern(self.Subscription)
 
 
-@dataclass
+@dataclass(slots=True, kw_only=True)
 class VMResource(Resource):
     osType: str
     osName: str
@@ -48,9 +62,16 @@ class VMResource(Resource):
     publisher: str
     sku: str
     RSV: str
+    # filled in by ResourceSummarizer.check_windows_vms / check_linux_vms
+    Size: str = None
+    extentions: list = None
+    dsc_status: str = None
+    dsc_compliant: bool = None
+    dcr_sec: bool = None
+    dcr_shd: bool = None
 
 
-@dataclass
+@dataclass(slots=True, kw_only=True)
 class SQLVMResource(Resource):
     policy_name: str
     RSV: str
@@ -0,0 +1,96 @@
+import random
+import threading
+import time
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+from azure_client import ThrottledError
+from instrumentation import retry
+from logger import get_logger
+
+
+logger = get_logger(name=__name__)
+
+
+class TokenBucket:
+
+    def __init__(self, rate: float, burst: int) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = float(burst)
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens +
+                                  (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+class VMEnricher:
+
+    def __init__(self,
+                 max_workers: int = 16,
+                 per_subscription: int = 4,
+                 rate_per_subscription: float = 20.0,
+                 burst_per_subscription: int = 100,
+                 retries: int = 5,
+                 backoff: float = 1.0) -> None:
+        self.max_workers = max_workers
+        self.per_subscription = per_subscription
+        self.rate_per_subscription = rate_per_subscription
+        self.burst_per_subscription = burst_per_subscription
+        self.retries = retries
+        self.backoff = backoff
+        self._lock = threading.Lock()
+        self._limits = defaultdict(
+            lambda: threading.BoundedSemaphore(self.per_subscription))
+        self._buckets = defaultdict(
+            lambda: TokenBucket(self.rate_per_subscription, self.burst_per_subscription))
+
+    def _limit(self, subscription: str):
+        # concurrent calls are capped by the semaphore, calls per second by the bucket
+        with self._lock:
+            return self._limits[subscription], self._buckets[subscription]
+
+    def _run_one(self, vm, enrich):
+        limit, bucket = self._limit(vm.Subscription)
+        with limit:
+            for attempt in range(self.retries + 1):
+                bucket.acquire()
+                try:
+                    return enrich(vm)
+                except ThrottledError as e:
+                    if attempt == self.retries:
+                        raise
+                    delay = self.backoff * 2 ** attempt
+                    delay += random.uniform(0, delay / 2)
+                    # never retry sooner than ARM asked us to
+                    if e.retry_after is not None:
+                        delay = max(delay, e.retry_after)
+                    logger.warning(
+                        f"{vm.Name} throttled, retrying in {delay:.1f}s")
+                    retry("arm.get")
+                    time.sleep(delay)
+
+    def run(self, vms, enrich) -> list:
+        failures = []
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            futures = {executor.submit(self._run_one, vm, enrich): vm
+                       for vm in vms}
+            for future in as_completed(futures):
+                vm = futures[future]
+                try:
+                    future.result()
+                except Exception as e:
+                    logger.error(f"Failed to enrich {vm.Name}: {e}")
+                    failures.append((vm, e))
+        return failures
@@ -0,0 +1,211 @@
+import cProfile
+import json
+import os
+import pstats
+import threading
+import time
+from contextlib import contextmanager, nullcontext
+
+
+# upper bounds in seconds, cumulative like Prometheus histograms
+latency_buckets = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0)
+
+
+class Metric:
+
+    __slots__ = ("count", "errors", "retries", "seconds", "bytes", "buckets")
+
+    def __init__(self) -> None:
+        self.count = 0
+        self.errors = 0
+        self.retries = 0
+        self.seconds = 0.0
+        self.bytes = 0
+        self.buckets = [0] * len(latency_buckets)
+
+    def observe(self, seconds: float, nbytes: int, error: bool):
+        self.count += 1
+        self.errors += error
+        self.seconds += seconds
+        self.bytes += nbytes
+        for i, bound in enumerate(latency_buckets):
+            if seconds <= bound:
+                self.buckets[i] += 1
+                break
+
+    def as_dict(self) -> dict:
+        cumulative = 0
+        histogram = dict()
+        for bound, n in zip(latency_buckets, self.buckets):
+            cumulative += n
+            histogram[str(bound)] = cumulative
+        histogram["+Inf"] = self.count
+        return {"count": self.count, "errors": self.errors, "retries": self.retries,
+                "seconds": round(self.seconds, 6), "bytes": self.bytes, "buckets": histogram}
+
+
+class Timing:
+
+    __slots__ = ("metrics", "name", "start", "bytes")
+
+    def __init__(self, metrics, name: str) -> None:
+        self.metrics = metrics
+        self.name = name
+        self.bytes = 0
+
+    def add_bytes(self, nbytes: int):
+        self.bytes += nbytes
+
+    def __enter__(self):
+        self.start = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.metrics.record(self.name, time.perf_counter() - self.start,
+                            nbytes=self.bytes, error=exc_type is not None)
+
+
+class _NullTiming:
+
+    __slots__ = ()
+
+    def add_bytes(self, nbytes: int):
+        pass
+
+
+# handed out when metrics are off, so a disabled timer costs one call and a flag check
+_null_timer = nullcontext(_NullTiming())
+
+
+class Metrics:
+
+    def __init__(self, enabled: bool = False) -> None:
+        self.enabled = enabled
+        self.metrics = dict()
+        self._lock = threading.Lock()
+
+    def _metric(self, name: str) -> Metric:
+        metric = self.metrics.get(name)
+        if metric is None:
+            metric = self.metrics.setdefault(name, Metric())
+        return metric
+
+    def timer(self, name: str):
+        if not self.enabled:
+            return _null_timer
+        return Timing(self, name)
+
+    def record(self, name: str, seconds: float, nbytes: int = 0, error: bool = False):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._metric(name).observe(seconds, nbytes, error)
+
+    def retry(self, name: str):
+        if not self.enabled:
+            return
+        with self._lock:
+            self._metric(name).retries += 1
+
+    def reset(self):
+        with self._lock:
+            self.metrics = dict()
+
+    def summary(self) -> dict:
+        with self._lock:
+            return {name: metric.as_dict() for name, metric in sorted(self.metrics.items())}
+
+    def prometheus(self, prefix: str = "azure_report") -> str:
+        # textfile collector format, one histogram plus counters per timer name
+        rows = []
+        for name, metric in self.summary().items():
+            labels = f'name="{name}"'
+            for bound, n in metric["buckets"].items():
+                rows.append(
+                    f'{prefix}_seconds_bucket{{{labels},le="{bound}"}} {n}')
+            rows.append(f"{prefix}_seconds_sum{{{labels}}} {metric['seconds']}")
+            rows.append(f"{prefix}_seconds_count{{{labels}}} {metric['count']}")
+            rows.append(f"{prefix}_errors_total{{{labels}}} {metric['errors']}")
+            rows.append(f"{prefix}_retries_total{{{labels}}} {metric['retries']}")
+            rows.append(f"{prefix}_bytes_total{{{labels}}} {metric['bytes']}")
+        header = [f"# TYPE {prefix}_seconds histogram",
+                  f"# TYPE {prefix}_errors_total counter",
+                  f"# TYPE {prefix}_retries_total counter",
+                  f"# TYPE {prefix}_bytes_total counter"]
+        return "\n".join(header + rows) + "\n"
+
+    def export(self, path: str = "files/metrics"):
+        # files/metrics.json for people, files/metrics.prom for node_exporter
+        if not self.enabled:
+            return
+        with open(f"{path}.json", "w") as f:
+            json.dump(self.summary(), f, indent=2)
+        with open(f"{path}.prom", "w") as f:
+            f.write(self.prometheus())
+        print(f"Wrote metrics to {path}.json and {path}.prom")
+
+
+# process-wide, turned on with REPORT_METRICS=1 or enable()
+metrics = Metrics(enabled=os.getenv("REPORT_METRICS", "") not in ("", "0"))
+
+
+def enable():
+    metrics.enabled = True
+
+
+# bound once, so a disabled timer is a single call
+timer = metrics.timer
+record = metrics.record
+retry = metrics.retry
+
+
+# profilers of the pool threads that ran while profile() was active
+_thread_profiles = None
+_thread_profiles_lock = threading.Lock()
+
+
+@contextmanager
+def profile(path: str = os.getenv("REPORT_PROFILE")):
+    # cProfile around the block when a path is given, view with python -m pstats.
+    # A profiler only sees the thread that enabled it, so work on pool threads
+    # is collected through profile_thread() and merged in here
+    global _thread_profiles
+    if not path:
+        yield
+        return
+    profiler = cProfile.Profile()
+    _thread_profiles = []
+    profiler.enable()
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _thread_profiles_lock:
+            thread_profiles, _thread_profiles = _thread_profiles, None
+        stats = pstats.Stats(profiler)
+        for thread_profile in thread_profiles:
+            stats.add(thread_profile)
+        stats.dump_stats(path)
+        print(f"Wrote profile to {path}")
+
+
+@contextmanager
+def profile_thread():
+    # for work handed to a pool thread, a no-op unless profile() is running
+    if _thread_profiles is None:
+        yield
+        return
+    profiler = cProfile.Profile()
+    try:
+        profiler.enable()
+    except ValueError:
+        # a profiler that already sees every thread is active
+        yield
+        return
+    try:
+        yield
+    finally:
+        profiler.disable()
+        with _thread_profiles_lock:
+            if _thread_profiles is not None:
+                _thread_profiles.append(profiler)
@@ -0,0 +1,47 @@
+import json
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+from instrumentation import timer
+
+
+def loads(raw: bytes):
+    return orjson.loads(raw) if orjson is not None else json.loads(raw)
+
+
+def _parse(raw: bytes):
+    with timer("json.load") as timing:
+        timing.add_bytes(len(raw))
+        return loads(raw)
+
+
+def read_json_file(filename: str):
+    with open(filename, "rb") as f:
+        raw = f.read()
+    return raw, _parse(raw)
+
+
+def _read(filename: str):
+    with open(filename, "rb") as f:
+        return filename, f.read()
+
+
+def read_json_files(filenames, max_workers: int = 8):
+    # the pool only does the file I/O, parsing stays on the consuming thread
+    # where it does not fight the readers for the GIL. Files are yielded in
+    # input order with at most a couple per worker read ahead.
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        pending = deque()
+        for filename in filenames:
+            pending.append(executor.submit(_read, filename))
+            if len(pending) >= 2 * max_workers:
+                filename, raw = pending.popleft().result()
+                yield filename, raw, _parse(raw)
+        while pending:
+            filename, raw = pending.popleft().result()
+            yield filename, raw, _parse(raw)
@@ -1,33 +1,89 @@
+import atexit
+import json
 import logging
+import os
+import queue
+import threading
 from datetime import datetime
+from logging.handlers import QueueHandler, QueueListener
 
 
 line = "-----------------------------------------------------------------------------"
 
+log_format = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+_lock = threading.Lock()
+_queue_handler = None
+_listener = None
+
+
+class JsonLinesFormatter(logging.Formatter):
+
+    def format(self, record: logging.LogRecord) -> str:
+        entry = {"time": self.formatTime(record),
+                 "logger": record.name,
+                 "level": record.levelname,
+                 "thread": record.threadName,
+                 "message": record.getMessage()}
+        return json.dumps(entry)
+
+
+def configure(log_dir: str = "files", json_lines: bool = None, level: int = logging.DEBUG) -> QueueHandler:
+    # one console and one file handler for the whole process, fed through a
+    # queue so the threads that log never wait on the file
+    global _queue_handler, _listener
+    with _lock:
+        if _queue_handler is not None:
+            return _queue_handler
+
+        if json_lines is None:
+            json_lines = os.getenv("REPORT_LOG_FORMAT", "").lower() == "json"
+
+        c_handler = logging.StreamHandler()
+        c_handler.setLevel(level)
+        c_handler.setFormatter(logging.Formatter(log_format))
+
+        timestamp = datetime.now().strftime("%m-%d-%Y-%H:%M:%S")
+        if json_lines:
+            f_handler = logging.FileHandler(
+                os.path.join(log_dir, f"resource_report_{timestamp}.jsonl"))
+            f_handler.setFormatter(JsonLinesFormatter())
+        else:
+            f_handler = logging.FileHandler(
+                os.path.join(log_dir, f"resource_report_{timestamp}.log"))
+            f_handler.setFormatter(logging.Formatter(log_format))
+        f_handler.setLevel(level)
+
+        log_queue = queue.SimpleQueue()
+        _listener = QueueListener(
+            log_queue, c_handler, f_handler, respect_handler_level=True)
+        _listener.start()
+        # drains whatever is still queued before the process exits
+        atexit.register(shutdown)
+
+        _queue_handler = QueueHandler(log_queue)
+        return _queue_handler
+
+
+def shutdown():
+    global _queue_handler, _listener
+    with _lock:
+        if _listener is not None:
+            _listener.stop()
+            for handler in _listener.handlers:
+                handler.close()
+        _listener = None
+        _queue_handler = None
+
 
 def get_logger(name=__name__):
 
-    # Create a custom logger
-    logger = logging.getLogger(name)
+    handler = configure()
 
-    # Create handlers
-    c_handler = logging.StreamHandler()
-    f_handler = logging.FileHandler(
-        f'files/resource_report_{datetime.now().strftime("%m-%d-%Y-%H:%M:%S")}.log')
-    c_handler.setLevel(logging.DEBUG)
-    f_handler.setLevel(logging.DEBUG)
-
-    # Create formatters and add it to handlers
-    c_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    f_format = logging.Formatter(
-        '%(asctime)s - %(name)s - %(levelname)s - %(message)s')
-    c_handler.setFormatter(c_format)
-    f_handler.setFormatter(f_format)
-
-    # Add handlers to the logger
-    logger.addHandler(c_handler)
-    logger.addHandler(f_handler)
+    logger = logging.getLogger(name)
+    # calling this twice for the same name must not double every line
+    if handler not in logger.handlers:
+        logger.addHandler(handler)
     logger.setLevel(logging.DEBUG)
 
     return logger
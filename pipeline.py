@@ -0,0 +1,111 @@
+import time
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from instrumentation import profile_thread, record
+from logger import get_logger, line
+
+
+logger = get_logger(name=__name__)
+
+
+class PipelineError(Exception):
+    pass
+
+
+class Stage:
+
+    def __init__(self, name: str, func, depends=()) -> None:
+        self.name = name
+        self.func = func
+        self.depends = tuple(depends)
+        self.started = None
+        self.finished = None
+        self.error = None
+
+    @property
+    def duration(self) -> float:
+        if self.started is None or self.finished is None:
+            return None
+        return self.finished - self.started
+
+
+class Pipeline:
+
+    def __init__(self, max_workers: int = 8) -> None:
+        self.max_workers = max_workers
+        self.stages = dict()
+        self.started = None
+        self.finished = None
+
+    def add(self, name: str, func, depends=()):
+        # dependencies have to be added first, which also rules out cycles
+        if name in self.stages:
+            raise PipelineError(f"Stage {name} added twice")
+        for dependency in depends:
+            if dependency not in self.stages:
+                raise PipelineError(
+                    f"Stage {name} depends on unknown stage {dependency}")
+        self.stages[name] = Stage(name, func, depends)
+        return self
+
+    def _run_stage(self, stage: Stage):
+        logger.info(f"Stage {stage.name} started")
+        stage.started = time.perf_counter()
+        try:
+            with profile_thread():
+                stage.func()
+        except Exception as e:
+            stage.error = e
+            logger.error(f"Stage {stage.name} failed: {e}")
+        finally:
+            stage.finished = time.perf_counter()
+            record(f"stage.{stage.name}", stage.duration,
+                   error=stage.error is not None)
+
+    def run(self):
+        self.started = time.perf_counter()
+        pending = list(self.stages.values())
+        done = set()
+        running = dict()
+        failed = None
+
+        # every stage starts as soon as the last of its dependencies finishes
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            while True:
+                if failed is None:
+                    ready = [stage for stage in pending
+                             if all(dependency in done for dependency in stage.depends)]
+                    for stage in ready:
+                        pending.remove(stage)
+                        running[executor.submit(self._run_stage, stage)] = stage
+                if not running:
+                    break
+
+                finished, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in finished:
+                    stage = running.pop(future)
+                    if stage.error is None:
+                        done.add(stage.name)
+                    elif failed is None:
+                        # let the running stages finish, start nothing new
+                        failed = stage
+        self.finished = time.perf_counter()
+
+        if failed is not None:
+            raise PipelineError(
+                f"Stage {failed.name} failed: {failed.error}") from failed.error
+
+    def summary(self) -> str:
+        rows = [line, f"{'STAGE':<24}{'START':>10}{'TOOK':>10}  WAITED FOR"]
+        for stage in sorted(self.stages.values(),
+                            key=lambda stage: float("inf") if stage.started is None else stage.started):
+            if stage.started is None:
+                rows.append(f"{stage.name:<24}{'-':>10}{'-':>10}  skipped")
+                continue
+            status = "  failed" if stage.error is not None else ""
+            rows.append(f"{stage.name:<24}{stage.started - self.started:>9.2f}s{stage.duration:>9.2f}s  "
+                        f"{', '.join(stage.depends) or '-'}{status}")
+        if self.started is not None and self.finished is not None:
+            rows.append(f"{'total':<24}{'':>10}{self.finished - self.started:>9.2f}s")
+        rows.append(line)
+        return "\n".join(rows)
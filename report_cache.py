@@ -0,0 +1,46 @@
+import hashlib
+import json
+import os
+import re
+
+
+def content_digest(data) -> str:
+    return hashlib.sha256(json.dumps(data, sort_keys=True).encode()).hexdigest()
+
+
+def bytes_digest(raw: bytes) -> str:
+    return hashlib.sha256(raw).hexdigest()
+
+
+class SnapshotCache:
+
+    def __init__(self, cache_dir: str = "files/.report_cache") -> None:
+        self.cache_dir = cache_dir
+        self.hits = 0
+        self.misses = 0
+        os.makedirs(cache_dir, exist_ok=True)
+
+    def _path(self, namespace: str, key: str) -> str:
+        key = re.sub(r"[^\w.-]", "_", key)
+        return os.path.join(self.cache_dir, f"{namespace}__{key}.json")
+
+    def load(self, namespace: str, key: str, **inputs):
+        # an entry is only reused when every input digest it was computed from still matches
+        try:
+            with open(self._path(namespace, key)) as f:
+                entry = json.load(f)
+        except (OSError, ValueError):
+            entry = None
+
+        if entry is None or entry["inputs"] != inputs:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return entry["result"]
+
+    def store(self, namespace: str, key: str, result, **inputs):
+        path = self._path(namespace, key)
+        # write then rename, so an interrupted run never leaves half an entry
+        with open(f"{path}.tmp", "w") as f:
+            json.dump({"inputs": inputs, "result": result}, f)
+        os.replace(f"{path}.tmp", path)
@@ -0,0 +1,181 @@
+import csv
+import json
+import math
+from abc import ABC, abstractmethod
+from itertools import islice
+
+import xlsxwriter
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+    pq = None
+
+
+class BackendNotAvailable(Exception):
+
+    pass
+
+
+def _chunks(rows, chunk_size: int):
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, chunk_size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def _is_missing(value) -> bool:
+    return value is None or (isinstance(value, float) and math.isnan(value))
+
+
+def _json_default(value):
+    # numpy scalars coming out of DataFrame rows
+    return value.item() if hasattr(value, "item") else str(value)
+
+
+class OutputBackend(ABC):
+
+    extension = ""
+
+    def __init__(self, path: str, chunk_size: int = 10_000) -> None:
+        # "files/report" and "files/report.xlsx" name the same output
+        if path.endswith(f".{self.extension}"):
+            path = path[:-len(self.extension) - 1]
+        self.path = path
+        self.chunk_size = chunk_size
+
+    def table_path(self, name: str) -> str:
+        return f"{self.path}_{name}.{self.extension}"
+
+    @abstractmethod
+    def write_table(self, name: str, columns: list, rows, categories=()) -> int:
+        pass
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class CsvBackend(OutputBackend):
+
+    extension = "csv"
+
+    def write_table(self, name: str, columns: list, rows, categories=()) -> int:
+        count = 0
+        with open(self.table_path(name), "w", newline="", encoding="utf-8") as f:
+            writer = csv.writer(f)
+            writer.writerow(columns)
+            for chunk in _chunks(rows, self.chunk_size):
+                writer.writerows([["" if _is_missing(value) else value for value in row]
+                                  for row in chunk])
+                count += len(chunk)
+        return count
+
+
+class NdjsonBackend(OutputBackend):
+
+    extension = "ndjson"
+
+    def write_table(self, name: str, columns: list, rows, categories=()) -> int:
+        count = 0
+        with open(self.table_path(name), "w", encoding="utf-8") as f:
+            for chunk in _chunks(rows, self.chunk_size):
+                f.writelines(json.dumps({column: None if _is_missing(value) else value
+                                         for column, value in zip(columns, row)}, default=_json_default) + "\n"
+                             for row in chunk)
+                count += len(chunk)
+        return count
+
+
+class ParquetBackend(OutputBackend):
+
+    extension = "parquet"
+
+    def __init__(self, path: str, chunk_size: int = 10_000) -> None:
+        if pa is None:
+            raise BackendNotAvailable(
+                "Parquet output needs pyarrow, pip install pyarrow")
+        super().__init__(path, chunk_size)
+
+    def write_table(self, name: str, columns: list, rows, categories=()) -> int:
+        count = 0
+        writer = None
+        try:
+            for chunk in _chunks(rows, self.chunk_size):
+                arrays = []
+                for column, values in zip(columns, zip(*chunk)):
+                    array = pa.array([None if _is_missing(value) else value for value in values],
+                                     from_pandas=True)
+                    if pa.types.is_null(array.type):
+                        # an all-empty chunk says nothing about the type, keep it a string
+                        array = array.cast(pa.string())
+                    if column in categories:
+                        array = array.dictionary_encode()
+                    arrays.append(array)
+                table = pa.Table.from_arrays(arrays, names=columns)
+                if writer is None:
+                    writer = pq.ParquetWriter(
+                        self.table_path(name), table.schema)
+                else:
+                    table = table.cast(writer.schema)
+                writer.write_table(table)
+                count += len(chunk)
+        finally:
+            if writer is not None:
+                writer.close()
+        if writer is None:
+            pq.write_table(pa.table({column: pa.array([], pa.string()) for column in columns}),
+                           self.table_path(name))
+        return count
+
+
+class XlsxBackend(OutputBackend):
+
+    extension = "xlsx"
+
+    def __init__(self, path: str, chunk_size: int = 10_000) -> None:
+        super().__init__(path, chunk_size)
+        # constant_memory flushes every row to disk once the next one starts,
+        # so peak memory does not grow with the report
+        self.workbook = xlsxwriter.Workbook(
+            f"{self.path}.{self.extension}", {"constant_memory": True})
+        self.header_format = self.workbook.add_format(
+            {"bold": True, "border": 1})
+
+    def write_table(self, name: str, columns: list, rows, categories=()) -> int:
+        worksheet = self.workbook.add_worksheet(name)
+        worksheet.write_row(0, 0, columns, self.header_format)
+        count = 0
+        for count, row in enumerate(rows, start=1):
+            # same cell values pandas.to_excel produces: lists as text, NaN as blank
+            worksheet.write_row(count, 0, [str(value) if isinstance(value, list)
+                                           else None if _is_missing(value) else value
+                                           for value in row])
+        return count
+
+    def close(self):
+        self.workbook.close()
+
+
+output_backends = {
+    "csv": CsvBackend,
+    "ndjson": NdjsonBackend,
+    "parquet": ParquetBackend,
+    "xlsx": XlsxBackend,
+}
+
+
+def get_backend(name: str, path: str, chunk_size: int = 10_000) -> OutputBackend:
+    if name not in output_backends:
+        raise ValueError(
+            f"Unknown output backend {name}, choose from {', '.join(output_backends)}")
+    return output_backends[name](path, chunk_size=chunk_size)
@@ -1,16 +1,52 @@
+import os
+
 from summary_base import JsonCombiner, ResourceSummarizer
 from summary_reporter import SummaryReporter
+from pipeline import Pipeline
+import instrumentation
 import logger
 
 
-full_list = JsonCombiner(folder_path="./files")
-resource_summary = ResourceSummarizer(combined_dict=full_list)
-resource_summary.output_xlsx()
-resource_summary.categorize_resources()
-resource_summary.check_windows_vms()
-resource_summary.check_linux_vms()
-
+full_list = JsonCombiner(folder_path="./files", preload=False)
+resource_summary = ResourceSummarizer(combined_dict=full_list, fetch=False)
 reporter = SummaryReporter(rs=resource_summary)
-reporter.report()
+# csv, ndjson, parquet or xlsx, for the resource list and the compliance table
+backend = os.getenv("REPORT_BACKEND", "csv")
+
+# alerts, backup status, DSC status and the VM details are independent fetches,
+# each later stage starts as soon as the stages it needs are done
+pipeline = Pipeline()
+pipeline.add("subscription_ids", resource_summary.fetch_subscription_ids)
+pipeline.add("read_inventory", full_list.combine_files_to_dict)
+pipeline.add("dsc_status", resource_summary.fetch_dsc_status)
+pipeline.add("alerts", resource_summary.fetch_alerts,
+             depends=["subscription_ids"])
+pipeline.add("backup_status", resource_summary.fetch_backup_status,
+             depends=["subscription_ids"])
+pipeline.add("vm_details", resource_summary.fetch_vm_details,
+             depends=["subscription_ids"])
+pipeline.add("resources", resource_summary.load_resources,
+             depends=["read_inventory", "alerts"])
+pipeline.add("output", lambda: resource_summary.output(backend, "files/resource"),
+             depends=["resources"])
+pipeline.add("categorize", resource_summary.categorize_resources,
+             depends=["resources", "backup_status"])
+pipeline.add("windows_vms", resource_summary.check_windows_vms,
+             depends=["categorize", "dsc_status", "vm_details"])
+pipeline.add("linux_vms", resource_summary.check_linux_vms,
+             depends=["categorize", "vm_details"])
+pipeline.add("compliance", lambda: reporter.output(backend),
+             depends=["output", "windows_vms", "linux_vms"])
+# the old per-resource log report, rendered from the same compliance table
+if os.getenv("REPORT_LOG_DETAILS", "") not in ("", "0"):
+    pipeline.add("log_report", reporter.report, depends=["compliance"])
+
+# REPORT_METRICS=1 exports call metrics, REPORT_PROFILE=<file> profiles the run
+try:
+    with instrumentation.profile():
+        pipeline.run()
+finally:
+    print(pipeline.summary())
+    instrumentation.metrics.export()
 
 print("Done")
@@ -23,6 +23,6 @@ do
 done
 
 echo "Generating AKS Version Report..."
-python3 aks_report.py
+python3 aks_report.py "$@"
 
 rm files/*.json
\ No newline at end of file
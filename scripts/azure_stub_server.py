@@ -0,0 +1,142 @@
+#!/usr/bin/env python3
+# Local stand-in for the Azure management endpoints used by the reports.
+#
+#   python3 scripts/azure_stub_server.py --graph-fixture rows.json --port 8080
+#   AZURE_MANAGEMENT_URL=http://localhost:8080 python3 resource_summary.py
+#
+# The graph fixture is a JSON list of rows. Rows are filtered on
+# subscriptionId when the request is scoped and served $top at a time with
+# $skipToken paging, the same way Resource Graph does.
+#
+# The DSC fixture is a JSON list of automation nodes, served for every
+# automation account .../nodes request with $top/$skip and nextLink paging.
+# Without one, --dsc-nodes N serves N generated nodes; the report asks for
+# 2000 per page, so the default of 4500 comes back in three pages.
+# --latency adds a fixed delay per request to mimic the real round trip.
+# --throttle answers the first N Resource Graph requests with 429 and a
+# Retry-After header, to exercise the client's retries.
+
+import argparse
+import json
+import random
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlencode, urlparse
+
+
+dsc_statuses = ["Compliant", "NotCompliant", "Failed", "Pending", "Unresponsive"]
+
+
+def make_dsc_nodes(n: int, seed: int = 1) -> list:
+    # the last tenth re-register earlier names, and names differ in case
+    # the way node registrations do
+    rng = random.Random(seed)
+    nodes = []
+    for i in range(n):
+        name = f"win-vm-{i % (n * 9 // 10 or 1):05d}"
+        nodes.append({"name": name.upper() if rng.random() < 0.3 else name,
+                      "properties": {"status": rng.choice(dsc_statuses)}})
+    return nodes
+
+
+class AzureStubHandler(BaseHTTPRequestHandler):
+
+    graph_rows = []
+    dsc_nodes = []
+    latency = 0.0
+    throttle = 0
+    retry_after = 1
+    _throttle_lock = threading.Lock()
+
+    def _send_json(self, payload, status=200, headers=None):
+        body = json.dumps(payload).encode()
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        for name, value in (headers or {}).items():
+            self.send_header(name, value)
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        time.sleep(self.latency)
+        url = urlparse(self.path)
+        if not url.path.endswith("/nodes"):
+            return self._send_json({"error": "not found"}, status=404)
+
+        params = {k: v[-1] for k, v in parse_qs(url.query).items()}
+        top = int(params.get("$top", 100))
+        skip = int(params.get("$skip", 0))
+        page = {"value": self.dsc_nodes[skip:skip + top]}
+        if skip + top < len(self.dsc_nodes):
+            params["$skip"] = skip + top
+            page["nextLink"] = f"http://{self.headers['Host']}{url.path}?{urlencode(params)}"
+        self._send_json(page)
+
+    def do_POST(self):
+        time.sleep(self.latency)
+        if not self.path.startswith("/providers/Microsoft.ResourceGraph/resources"):
+            return self._send_json({"error": "not found"}, status=404)
+
+        body = json.loads(self.rfile.read(
+            int(self.headers.get("Content-Length", 0))))
+        with self._throttle_lock:
+            throttled = AzureStubHandler.throttle > 0
+            if throttled:
+                AzureStubHandler.throttle -= 1
+        if throttled:
+            return self._send_json({"error": {"code": "RateLimiting"}}, status=429,
+                                   headers={"Retry-After": str(self.retry_after)})
+        options = body.get("options", {})
+        subscriptions = body.get("subscriptions")
+
+        if "ResourceContainers" in body["query"]:
+            rows = [{"name": sub, "subscriptionId": sub}
+                    for sub in sorted({row.get("subscriptionId") for row in self.graph_rows})]
+        else:
+            rows = [row for row in self.graph_rows
+                    if not subscriptions or row.get("subscriptionId") in subscriptions]
+
+        top = int(options.get("$top", 1000))
+        skip = int(options.get("$skipToken", 0))
+        page = {"totalRecords": len(rows), "count": len(rows[skip:skip + top]),
+                "data": rows[skip:skip + top]}
+        if skip + top < len(rows):
+            page["$skipToken"] = str(skip + top)
+        self._send_json(page)
+
+    def log_message(self, format, *args):
+        pass
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--port", type=int, default=8080)
+    parser.add_argument("--graph-fixture", default=None)
+    parser.add_argument("--dsc-fixture", default=None)
+    parser.add_argument("--dsc-nodes", type=int, default=4500,
+                        help="generated DSC nodes to serve when no --dsc-fixture is given")
+    parser.add_argument("--latency", type=float, default=0.0,
+                        help="seconds to wait before answering each request")
+    parser.add_argument("--throttle", type=int, default=0,
+                        help="answer the first N Resource Graph requests with 429")
+    parser.add_argument("--retry-after", type=int, default=1)
+    args = parser.parse_args()
+
+    AzureStubHandler.latency = args.latency
+    AzureStubHandler.throttle = args.throttle
+    AzureStubHandler.retry_after = args.retry_after
+
+    if args.graph_fixture:
+        with open(args.graph_fixture) as f:
+            AzureStubHandler.graph_rows = json.load(f)
+    if args.dsc_fixture:
+        with open(args.dsc_fixture) as f:
+            AzureStubHandler.dsc_nodes = json.load(f)
+    else:
+        AzureStubHandler.dsc_nodes = make_dsc_nodes(args.dsc_nodes)
+
+    server = ThreadingHTTPServer(("127.0.0.1", args.port), AzureStubHandler)
+    print(f"Serving Azure stub on http://127.0.0.1:{args.port}")
+    server.serve_forever()
@@ -0,0 +1,87 @@
+#!/usr/bin/env python3
+# Times alert-to-resource matching with summary_base.AlertScopeIndex.
+#
+#   python3 scripts/bench_alert_index.py
+#   python3 scripts/bench_alert_index.py --resources 10000 20000 40000 --alerts-per 0.1 --old
+#
+# For every N, N resources and N * alerts-per metric alerts with --scopes
+# scopes each are generated. Half of the scopes are full resource ids and
+# half are names only, so both lookups are exercised. Per-resource time should
+# stay flat as N grows. --old also runs the resources x alerts x scopes loop
+# the summarizer used before the index, on the smallest N only.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summary_base import AlertScopeIndex  # noqa: E402
+
+
+def make_resources(n: int) -> list:
+    return [{"Name": f"vm-{i:06d}",
+             "Id": f"/subscriptions/sub-{i % 14}/resourceGroups/rg-{i % 500}/providers/Microsoft.Compute/virtualMachines/vm-{i:06d}"}
+            for i in range(n)]
+
+
+def make_alerts(resources: list, m: int, scopes: int) -> list:
+    alerts = []
+    for i in range(m):
+        targets = random.sample(resources, scopes)
+        alerts.append({"name": f"alert-{i}",
+                       "scopes": [target["Id"] if j % 2 == 0 else f"/{target['Name']}"
+                                  for j, target in enumerate(targets)]})
+    return alerts
+
+
+def old_match(resources: list, alerts: list):
+    for resource in resources:
+        resource["alerts"] = []
+        for alert in alerts:
+            for scope in alert["scopes"]:
+                if resource["Name"] == scope.split('/')[-1]:
+                    resource["alerts"].append(alert)
+
+
+def run(n: int, alerts_per: float, scopes: int) -> tuple:
+    resources = make_resources(n)
+    alerts = make_alerts(resources, max(1, int(n * alerts_per)), scopes)
+
+    start = time.perf_counter()
+    index = AlertScopeIndex(alerts)
+    built = time.perf_counter()
+    matched = sum(len(index.match(resource)) for resource in resources)
+    done = time.perf_counter()
+    return resources, alerts, built - start, done - built, matched
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resources", type=int, nargs="+",
+                        default=[5_000, 10_000, 20_000, 40_000, 80_000])
+    parser.add_argument("--alerts-per", type=float, default=0.1,
+                        help="alerts per resource")
+    parser.add_argument("--scopes", type=int, default=4,
+                        help="scopes per alert")
+    parser.add_argument("--old", action="store_true",
+                        help="also time the old nested loop on the smallest size")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"{'RESOURCES':>10}{'ALERTS':>8}{'BUILD':>10}{'MATCH':>10}{'US/RES':>9}{'MATCHES':>9}")
+    for n in sorted(args.resources):
+        resources, alerts, build, match, matched = run(
+            n, args.alerts_per, args.scopes)
+        print(f"{n:>10}{len(alerts):>8}{build:>9.3f}s{match:>9.3f}s{match / n * 1e6:>9.2f}{matched:>9}")
+
+    if args.old:
+        n = min(args.resources)
+        resources, alerts, _, match, _ = run(n, args.alerts_per, args.scopes)
+        start = time.perf_counter()
+        old_match(resources, alerts)
+        old = time.perf_counter() - start
+        print(f"old loop at {n} resources: {old:.3f}s, index {match:.3f}s")
@@ -0,0 +1,84 @@
+#!/usr/bin/env python3
+# Compares DSC compliance lookup through summary_base.DSCStatusIndex with the
+# per-VM scan check_windows_vms used before.
+#
+#   python3 scripts/bench_dsc_index.py
+#   python3 scripts/bench_dsc_index.py --nodes 5000 --vms 4000
+#
+# Nodes are spread over names that differ from the VM names only in case,
+# some names are registered in several automation accounts with different
+# statuses, and some VMs have no node at all. Both ways must give the same
+# dsc_status and dsc_compliant for every VM.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summary_base import DSCStatusIndex  # noqa: E402
+
+
+statuses = ["Compliant", "NotCompliant", "Failed", "Pending", "Unresponsive"]
+
+
+def make_nodes(n: int, names: list) -> list:
+    return [{"name": random.choice(names).upper() if random.random() < 0.5 else random.choice(names),
+             "properties": {"status": random.choice(statuses)}}
+            for _ in range(n)]
+
+
+def old_lookup(vm_names: list, all_dsc_status: list) -> list:
+    results = []
+    for vm_name in vm_names:
+        dsc_status = None
+        dsc_compliant = None
+        for dsc_node in all_dsc_status:
+            if dsc_node["name"].lower() == vm_name.lower():
+                dsc_status = dsc_node["properties"]['status']
+                dsc_compliant = dsc_node["properties"]['status'] == 'Compliant'
+                if dsc_compliant:
+                    break
+        results.append((dsc_status, dsc_compliant))
+    return results
+
+
+def index_lookup(vm_names: list, all_dsc_status: list) -> list:
+    index = DSCStatusIndex()
+    for node in all_dsc_status:
+        index.add(node["name"], node["properties"]["status"])
+    results = []
+    for vm_name in vm_names:
+        dsc_status = index.status(vm_name)
+        results.append((dsc_status, None if dsc_status is None else dsc_status == 'Compliant'))
+    return results
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--nodes", type=int, default=2500)
+    parser.add_argument("--vms", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    vm_names = [f"win-vm-{i:05d}" for i in range(args.vms)]
+    # about one VM in ten has no DSC node
+    nodes = make_nodes(args.nodes, vm_names[:args.vms - args.vms // 10])
+
+    start = time.perf_counter()
+    old = old_lookup(vm_names, nodes)
+    old_time = time.perf_counter() - start
+
+    start = time.perf_counter()
+    new = index_lookup(vm_names, nodes)
+    new_time = time.perf_counter() - start
+
+    print(f"{args.nodes} nodes, {args.vms} VMs")
+    print(f"old scan: {old_time:.3f}s")
+    print(f"index:    {new_time:.4f}s (build plus lookups)")
+    print(f"identical results: {old == new}")
+    if old != new:
+        sys.exit(1)
@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+# Times inventory ingestion over a directory of resource-group files.
+#
+#   python3 scripts/bench_json_ingest.py --generate /tmp/inventory --files 3000
+#   python3 scripts/bench_json_ingest.py --folder /tmp/inventory --workers 8
+#   sudo python3 scripts/bench_json_ingest.py --folder /tmp/inventory --drop-caches
+#
+# --generate writes <subscription>__<resource group>.json files shaped like
+# the az resource list output scripts/list_rg_resources.sh saves. Timing
+# compares the old serial json.load + extend with summary_base.JsonCombiner
+# streaming through json_ingest.read_json_files. --drop-caches empties the
+# page cache before each run (Linux, root) so the file reads are cold.
+
+import argparse
+import glob
+import json
+import os
+import random
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from summary_base import JsonCombiner  # noqa: E402
+
+
+resource_types = ["Microsoft.Compute/virtualMachines", "Microsoft.Compute/disks",
+                  "Microsoft.Network/networkInterfaces", "Microsoft.Storage/storageAccounts",
+                  "Microsoft.KeyVault/vaults", "Microsoft.Sql/servers", "Microsoft.Web/sites"]
+
+
+def generate(folder: str, files: int, per_file: int, subscriptions: int):
+    os.makedirs(folder, exist_ok=True)
+    for i in range(files):
+        subscription = f"SUB-{i % subscriptions:03d}"
+        rg = f"rg-{i:05d}"
+        resources = [{"Name": f"res-{i:05d}-{j:03d}",
+                      "Type": random.choice(resource_types),
+                      "Location": random.choice(["australiaeast", "australiasoutheast", "uksouth"]),
+                      "Repo": random.choice([None, "infra", "platform"]),
+                      "Id": f"/subscriptions/{subscription}/resourceGroups/{rg}/providers/x/res-{i:05d}-{j:03d}"}
+                     for j in range(random.randint(per_file // 2, per_file * 3 // 2))]
+        with open(os.path.join(folder, f"{subscription}__{rg}.json"), "w") as f:
+            json.dump(resources, f)
+
+
+def drop_caches():
+    subprocess.run(["sync"], check=True)
+    with open("/proc/sys/vm/drop_caches", "w") as f:
+        f.write("3\n")
+
+
+def serial(folder: str) -> int:
+    # the old combine_files_to_dict: one json.load per file in turn, every
+    # record extended into a single list
+    resources = []
+    for filename in sorted(glob.glob(os.path.join(folder, "*.json"))):
+        with open(filename) as f:
+            data = json.load(f)
+        subscription_n_rg = filename.split('/')[-1].split('.')[0].split('__')
+        for item in data:
+            item["ResourceGroup"] = subscription_n_rg[1]
+            item["Subscription"] = subscription_n_rg[0]
+        resources.extend(data)
+    return len(resources)
+
+
+def streaming(folder: str, workers: int) -> int:
+    combiner = JsonCombiner(folder_path=folder, max_workers=workers, preload=False)
+    return sum(1 for _ in combiner.iter_resources())
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--generate", metavar="FOLDER", default=None)
+    parser.add_argument("--files", type=int, default=3000)
+    parser.add_argument("--per-file", type=int, default=20,
+                        help="average resources per resource group file")
+    parser.add_argument("--subscriptions", type=int, default=14)
+    parser.add_argument("--folder", default=None)
+    parser.add_argument("--workers", type=int, default=8)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--drop-caches", action="store_true")
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    if args.generate:
+        generate(args.generate, args.files, args.per_file, args.subscriptions)
+        print(f"Wrote {args.files} files to {args.generate}")
+    folder = args.folder or args.generate
+    if not folder:
+        parser.error("give --folder or --generate")
+
+    for name, run in (("serial", lambda: serial(folder)),
+                      (f"streaming x{args.workers}", lambda: streaming(folder, args.workers))):
+        times = []
+        for _ in range(args.repeat):
+            if args.drop_caches:
+                drop_caches()
+            start = time.perf_counter()
+            count = run()
+            times.append(time.perf_counter() - start)
+        print(f"{name:<14} {count} resources  best {min(times):.3f}s  worst {max(times):.3f}s")
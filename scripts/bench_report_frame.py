@@ -0,0 +1,81 @@
+#!/usr/bin/env python3
+# Compares building the resource summary DataFrame from row tuples with
+# categoricals (ResourceSummarizer.resource_frame) against the dict-per-column
+# build output_xlsx did before.
+#
+#   python3 scripts/bench_report_frame.py
+#   python3 scripts/bench_report_frame.py --resources 500000
+#
+# Reports build time, the tracemalloc peak while building, and the frame's
+# own size from memory_usage(deep=True). Both frames must hold the same values.
+
+import argparse
+import os
+import random
+import sys
+import time
+import tracemalloc
+
+import pandas as pd
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_model import Resource  # noqa: E402
+from summary_base import ResourceSummarizer  # noqa: E402
+
+
+def make_resources(n: int) -> list:
+    locations = ["australiaeast", "australiasoutheast", "uksouth"]
+    types = ["Microsoft.Compute/virtualMachines", "Microsoft.Compute/disks", "Microsoft.Network/networkInterfaces",
+             "Microsoft.Storage/storageAccounts", "Microsoft.KeyVault/vaults", "Microsoft.Web/sites"]
+    return [Resource(Location=random.choice(locations), Name=f"res-{i:06d}", Repo=random.choice([None, "infra"]),
+                     Type=random.choice(types), ResourceGroup=f"rg-{i % 500:03d}",
+                     Subscription=f"AU-PROD-SUB{i % 14:03d}", Id=f"/x/res-{i:06d}")
+            for i in range(n)]
+
+
+def old_frame(resources: list) -> pd.DataFrame:
+    name_dict, type_dict, location_dict = dict(), dict(), dict()
+    rg_dict, subscription_dict, repo_tag_dict = dict(), dict(), dict()
+    for count, resource in enumerate(resources):
+        name_dict[count] = resource.Name
+        type_dict[count] = resource.Type
+        location_dict[count] = resource.Location
+        rg_dict[count] = resource.ResourceGroup
+        subscription_dict[count] = resource.Subscription
+        repo_tag_dict[count] = resource.Repo
+    return pd.DataFrame({"NAME": name_dict, "TYPE": type_dict, "LOCATION": location_dict,
+                         "SUBSCRIPTION": subscription_dict, "RESOURCEGROUP": rg_dict,
+                         "REPO(TAG)": repo_tag_dict})
+
+
+def measure(build) -> tuple:
+    tracemalloc.start()
+    start = time.perf_counter()
+    frame = build()
+    seconds = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return frame, seconds, peak / 2**20, frame.memory_usage(deep=True).sum() / 2**20
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resources", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    rs = ResourceSummarizer.__new__(ResourceSummarizer)
+    rs.all_resource_list = make_resources(args.resources)
+
+    print(f"{args.resources} resources")
+    old, *numbers = measure(lambda: old_frame(rs.all_resource_list))
+    print("old: {:.2f}s, {:.1f} MiB peak, {:.1f} MiB frame".format(*numbers))
+    new, *numbers = measure(rs.resource_frame)
+    print("new: {:.2f}s, {:.1f} MiB peak, {:.1f} MiB frame".format(*numbers))
+
+    same = old.astype(object).equals(new.astype(object))
+    print(f"identical values: {same}")
+    if not same:
+        sys.exit(1)
@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+# Measures live memory of the resource records built from the inventory, the
+# slotted, interned data_model classes against the plain dataclasses they
+# replaced.
+#
+#   python3 scripts/bench_resource_memory.py
+#   python3 scripts/bench_resource_memory.py --resources 200000
+#
+# The inventory is one JSON document parsed inside the measurement, and the
+# parsed dicts are dropped once the records exist, the way load_resources
+# does. What is left is what the records keep alive. The VM rows also get the
+# four fields check_windows_vms fills in, which the old class added to each
+# instance's __dict__ at run time.
+
+import argparse
+import gc
+import json
+import os
+import random
+import sys
+import tracemalloc
+from dataclasses import dataclass, field
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_model import Resource, VMResource  # noqa: E402
+
+
+# the classes as they were before slots and interning
+
+@dataclass(frozen=False)
+class OldResource:
+    Location: str
+    Name: str
+    Repo: str
+    Type: str
+    ResourceGroup: str
+    Subscription: str
+    Id: str
+    alerts: field(default_factory=list)
+    alerts_count: int
+
+
+@dataclass
+class OldVMResource(OldResource):
+    osType: str
+    osName: str
+    osVersion: str
+    isBackedUp: bool
+    lastbackup: str
+    lastBackup_status: str
+    lastRecoveryPoint: str
+    protection_status: str
+    policy_name: str
+    backupItemid: str
+    PowerStatus: str
+    offer: str
+    publisher: str
+    sku: str
+    RSV: str
+
+
+vm_fields = ("osType", "osName", "osVersion", "isBackedUp", "lastbackup", "lastBackup_status",
+             "lastRecoveryPoint", "protection_status", "policy_name", "backupItemid", "PowerStatus",
+             "offer", "publisher", "sku", "RSV")
+
+
+def make_inventory(n: int, vms: bool) -> str:
+    locations = ["australiaeast", "australiasoutheast", "uksouth"]
+    types = ["Microsoft.Compute/virtualMachines", "Microsoft.Compute/disks",
+             "Microsoft.Network/networkInterfaces", "Microsoft.Storage/storageAccounts"]
+    records = []
+    for i in range(n):
+        subscription, rg = f"AU-PROD-SUB{i % 14:03d}", f"rg-{i % 500:03d}"
+        record = {"Location": random.choice(locations), "Name": f"res-{i:06d}", "Repo": "infra",
+                  "Type": types[0] if vms else random.choice(types), "ResourceGroup": rg,
+                  "Subscription": subscription, "alerts": [], "alerts_count": 0,
+                  "Id": f"/subscriptions/{subscription}/resourceGroups/{rg}/providers/x/res-{i:06d}"}
+        if vms:
+            record.update(dict.fromkeys(vm_fields), osType="Windows", isBackedUp=True,
+                          PowerStatus="VM running", RSV=rg)
+        records.append(record)
+    return json.dumps(records)
+
+
+def measure(document: str, cls, vms: bool) -> float:
+    gc.collect()
+    tracemalloc.start()
+    records = json.loads(document)
+    built = [cls(**record) for record in records]
+    del records
+    if vms:
+        for vm in built:
+            vm.Size = "Standard_D2s_v3"
+            vm.extentions = []
+            vm.dsc_status = "Compliant"
+            vm.dsc_compliant = True
+    gc.collect()
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del built
+    return current / 1e6
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--resources", type=int, default=100_000)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    print(f"{args.resources} resources, live MB after construction")
+    for label, old, new, vms in (("Resource", OldResource, Resource, False),
+                                 ("VMResource, 4 enrichments", OldVMResource, VMResource, True)):
+        document = make_inventory(args.resources, vms)
+        print(f"{label:<27} {measure(document, old, vms):6.1f} -> {measure(document, new, vms):6.1f}")
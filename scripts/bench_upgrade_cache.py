@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+# Times AKSVersionProcessor.get_next_upgrades with and without its memo cache.
+#
+#   python3 scripts/bench_upgrade_cache.py
+#   python3 scripts/bench_upgrade_cache.py --clusters 50000 --regions 10 --versions 40
+#
+# Each region gets a synthetic get-versions document over --versions
+# releases, and clusters are spread over the regions and versions at random.
+# The uncached run calls the uncached path for every cluster; both runs have
+# to give the same answer for every cluster.
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from base import AKSVersionProcessor, AggressiveAKSUpgradeStrategy  # noqa: E402
+
+
+def make_versions(n: int) -> list:
+    versions = []
+    minor = 20
+    while len(versions) < n:
+        versions.extend(f"1.{minor}.{patch}" for patch in range(0, 12, 3))
+        minor += 1
+    return versions[:n]
+
+
+def make_region(versions: list) -> dict:
+    # every version can go to the later patches of its minor and the next minor
+    orchestrators = []
+    for version in versions:
+        minor = int(version.split(".")[1])
+        targets = [target for target in versions
+                   if target != version and int(target.split(".")[1]) in (minor, minor + 1)
+                   and [int(x) for x in target.split(".")] > [int(x) for x in version.split(".")]]
+        orchestrators.append({"orchestratorVersion": version,
+                              "upgrades": [{"orchestratorVersion": target} for target in targets] or None})
+    return {"orchestrators": orchestrators}
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clusters", type=int, default=10_000)
+    parser.add_argument("--regions", type=int, default=6)
+    parser.add_argument("--versions", type=int, default=25)
+    parser.add_argument("--seed", type=int, default=1)
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    versions = make_versions(args.versions)
+    # regions list a sliding window of releases, older clusters fall below it
+    regions = {f"region-{i}": make_region(versions[i % 3:]) for i in range(args.regions)}
+    clusters = [{"Location": random.choice(list(regions)), "k8sversion": random.choice(versions)}
+                for _ in range(args.clusters)]
+    strategy = AggressiveAKSUpgradeStrategy()
+
+    processor = AKSVersionProcessor()
+    start = time.perf_counter()
+    uncached = [processor._get_next_upgrades(cluster, regions[cluster["Location"]], strategy)
+                for cluster in clusters]
+    uncached_time = time.perf_counter() - start
+
+    processor = AKSVersionProcessor()
+    start = time.perf_counter()
+    cached = [processor.get_next_upgrades(cluster, regions[cluster["Location"]], strategy)
+              for cluster in clusters]
+    cached_time = time.perf_counter() - start
+
+    print(f"{args.clusters} clusters, {args.regions} regions, {args.versions} versions")
+    print(f"uncached: {uncached_time:.3f}s")
+    print(f"cached:   {cached_time:.3f}s ({processor.cache_hits} hits, {processor.cache_misses} misses)")
+    print(f"identical results: {uncached == cached}")
+    if uncached != cached:
+        sys.exit(1)
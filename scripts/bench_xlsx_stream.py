@@ -0,0 +1,113 @@
+#!/usr/bin/env python3
+# Compares wall time and peak RSS of AKSReporter.output_xlsx with and without
+# streaming=True.
+#
+#   python3 scripts/bench_xlsx_stream.py
+#   python3 scripts/bench_xlsx_stream.py --clusters 100000 --compare
+#
+# Every mode runs in its own process on the same synthetic fleet, so one
+# mode's peak cannot hide the other's. The fleet is built and the report
+# made before the write starts; the RSS figure is how far the process peak
+# rose during the write alone. --compare reads both workbooks back and checks
+# every sheet holds the same cells.
+
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from base import AKSReporter, AKSVersionProcessor, AggressiveAKSUpgradeStrategy, FileCombiner  # noqa: E402
+
+
+class SyntheticFleet(FileCombiner):
+
+    def __init__(self, clusters: int, subscriptions: int, regions: int) -> None:
+        super().__init__()
+        versions = [f"1.{minor}.{patch}" for minor in range(24, 29) for patch in (1, 5, 9)]
+        self.upgrades = {f"region-{i}": self._region(versions[i % 3:]) for i in range(regions)}
+        self.current_versions = {f"sub-{i:03d}": [] for i in range(subscriptions)}
+        for i in range(clusters):
+            version = versions[i % len(versions)]
+            self.current_versions[f"sub-{i % subscriptions:03d}"].append(
+                {"Name": f"aks-{i:06d}", "Location": f"region-{i % regions}", "k8sversion": version,
+                 "NodePools": [{"Name": f"pool{j}", "Version": versions[max(0, i % len(versions) - j)]}
+                               for j in range(3)]})
+
+    @staticmethod
+    def _region(versions: list) -> dict:
+        return {"orchestrators": [
+            {"orchestratorVersion": version,
+             "upgrades": [{"orchestratorVersion": target} for target in versions[i + 1:i + 4]] or None}
+            for i, version in enumerate(versions)]}
+
+    def _read_current(self) -> dict:
+        return self.current_versions
+
+    def _read_upgrades(self) -> dict:
+        return self.upgrades
+
+
+def peak_rss_mib() -> float:
+    # ru_maxrss is KiB on Linux
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024
+
+
+def child(mode: str, path: str, args):
+    reporter = AKSReporter(SyntheticFleet(args.clusters, args.subscriptions, args.regions),
+                           AKSVersionProcessor())
+    reporter.make_report(upgrade_strategy=AggressiveAKSUpgradeStrategy())
+    before = peak_rss_mib()
+    start = time.perf_counter()
+    reporter.output_xlsx(streaming=mode == "streaming", path=path)
+    seconds = time.perf_counter() - start
+    print(json.dumps({"seconds": seconds, "rss_growth": peak_rss_mib() - before}))
+
+
+def run(mode: str, path: str, args) -> dict:
+    proc = subprocess.run([sys.executable, __file__, "--child", mode, "--path", path,
+                           "--clusters", str(args.clusters), "--subscriptions", str(args.subscriptions),
+                           "--regions", str(args.regions)],
+                          capture_output=True, text=True, check=True)
+    # the DataFrame path prints its frame first, the result is the last line
+    return json.loads(proc.stdout.strip().splitlines()[-1])
+
+
+def same_workbooks(left: str, right: str) -> bool:
+    import pandas as pd
+
+    left, right = pd.read_excel(left, sheet_name=None), pd.read_excel(right, sheet_name=None)
+    return left.keys() == right.keys() and all(left[name].equals(right[name]) for name in left)
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--clusters", type=int, default=20_000)
+    parser.add_argument("--subscriptions", type=int, default=50)
+    parser.add_argument("--regions", type=int, default=6)
+    parser.add_argument("--compare", action="store_true",
+                        help="check both workbooks hold the same cells")
+    parser.add_argument("--child", choices=["dataframe", "streaming"], help=argparse.SUPPRESS)
+    parser.add_argument("--path", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        child(args.child, args.path, args)
+        sys.exit(0)
+
+    with tempfile.TemporaryDirectory() as folder:
+        paths = {mode: os.path.join(folder, f"{mode}.xlsx") for mode in ("dataframe", "streaming")}
+        print(f"{args.clusters} clusters, {args.subscriptions} subscriptions, {args.regions} regions")
+        for mode, path in paths.items():
+            result = run(mode, path, args)
+            print(f"{mode:<10} {result['seconds']:.2f}s  peak RSS +{result['rss_growth']:.0f} MiB")
+        if args.compare:
+            same = same_workbooks(paths["dataframe"], paths["streaming"])
+            print(f"identical sheets: {same}")
+            if not same:
+                sys.exit(1)
@@ -2,22 +2,62 @@ from abc import ABC, abstractmethod
 from ast import Sub
 from importlib import resources
 import os
-import json
 import glob
 from urllib import response
 import pandas as pd
 from collections import OrderedDict
-from az.cli import az
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from dataclasses import fields
+from operator import attrgetter
 from typing import List
-import requests
 from regex import W
 from logger import get_logger, line
+from azure_client import ArmClient, ResourceGraphClient, flatten_properties
+from enrichment import VMEnricher
+from report_output import get_backend
+from json_ingest import read_json_files
+from instrumentation import timer
 
 from data_model import Resource, VMResource, SQLVMResource, automation_account_map
 
 
 logger = get_logger(name=__name__)
 
+# alert rule types that can target a resource, with the API version to list them
+alert_rule_providers = {
+    "Microsoft.Insights/metricAlerts": "2018-03-01",
+    "Microsoft.Insights/activityLogAlerts": "2020-10-01",
+    "Microsoft.Insights/scheduledQueryRules": "2021-08-01",
+}
+
+
+# fields VMResource / SQLVMResource take straight from the backup query row
+_vm_backup_fields = ("osType", "osName", "osVersion", "isBackedUp", "lastbackup", "lastBackup_status",
+                     "lastRecoveryPoint", "protection_status", "policy_name", "backupItemid",
+                     "PowerStatus", "offer", "publisher")
+_sql_vm_backup_fields = ("policy_name", "protection_status",
+                         "lastbackup", "lastBackup_status", "isBackedUp")
+
+_resource_field_names = tuple(field.name for field in fields(Resource))
+_get_resource_fields = attrgetter(*_resource_field_names)
+
+
+def _resource_fields(resource: Resource) -> dict:
+    return dict(zip(_resource_field_names, _get_resource_fields(resource)))
+
+
+_automation_accounts = [(subscriptionId, rg, account)
+                        for subscriptionId, auto_accounts in automation_account_map.items()
+                        for rg, accounts in auto_accounts.items()
+                        for account in accounts]
+
+
+def _collect_into(attribute: str):
+    # handler for types that are reported as plain Resource records
+    def handler(summarizer, resources: list):
+        getattr(summarizer, attribute).extend(resources)
+    return handler
+
 
 class VirutalMachineOSTypeError(Exception):
     pass
@@ -32,42 +72,152 @@ class FileCombiner(ABC):
 
 class JsonCombiner(FileCombiner):
 
-    def __init__(self, folder_path: str, glob_pattern: str = "*.json") -> None:
+    def __init__(self, folder_path: str, glob_pattern: str = "*.json",
+                 max_workers: int = 8, preload: bool = True) -> None:
         super().__init__()
         self.resources = list()
         self.folder_path = folder_path
         self.glob_pattern = glob_pattern
-        self.combine_files_to_dict()
+        self.max_workers = max_workers
+        self.filenames = sorted(
+            glob.glob(os.path.join(self.folder_path, self.glob_pattern)))
+        if preload:
+            self.combine_files_to_dict()
+
+    @staticmethod
+    def _subscription_n_rg(filename: str) -> list:
+        # no time spend on slicing, hardcoded for now
+        return filename.split('/')[-1].split('.')[0].split('__')
+
+    @property
+    def subscriptions(self) -> set:
+        return {self._subscription_n_rg(filename)[0] for filename in self.filenames}
+
+    def _stream_files(self):
+        for filename, _, data in read_json_files(self.filenames, self.max_workers):
+            subscription_n_rg = self._subscription_n_rg(filename)
+            for item in data:
+                item["ResourceGroup"] = subscription_n_rg[1]
+                item["Subscription"] = subscription_n_rg[0]
+                yield item
+
+    def iter_resources(self):
+        if self.resources:
+            return iter(self.resources)
+        return self._stream_files()
 
     def combine_files_to_dict(self):
+        self.resources = list(self._stream_files())
 
-        for filename in glob.glob(os.path.join(self.folder_path, self.glob_pattern)):
 
-            with open(filename) as f:
-                # no time spend on slicing, hardcoded for now
-                subscription_n_rg = filename.split(
-                    '/')[-1].split('.')[0].split('__')
-                data = json.load(f)
-                for item in data:
-                    item["ResourceGroup"] = subscription_n_rg[1]
-                    item["Subscription"] = subscription_n_rg[0]
-                self.resources.extend(data)
+class AlertScopeIndex:
 
+    def __init__(self, alerts=()) -> None:
+        self.by_id = dict()
+        self.by_name = dict()
+        for alert in alerts:
+            self.add(alert)
 
-class ResourceSummarizer:
+    def add(self, alert: dict):
+        seen = set()
+        for scope in alert.get("scopes") or []:
+            scope_id = scope.rstrip('/').lower()
+            if scope_id in seen:
+                continue
+            seen.add(scope_id)
+            self.by_id.setdefault(scope_id, []).append(alert)
+            self.by_name.setdefault(
+                scope_id.split('/')[-1], []).append(alert)
 
-    def __init__(self, combined_dict: JsonCombiner) -> None:
-        self.subscriptions_list = set(
-            [resource["Subscription"] for resource in combined_dict.resources])
-        self.alerts_list = []
+    def match(self, resource: dict) -> list:
+        # exact ARM id first, fall back to the last segment of the scope
+        alerts = self.by_id.get((resource.get("Id") or "").lower())
+        if alerts is None:
+            alerts = self.by_name.get(resource["Name"].lower(), [])
+        return list(alerts)
 
-        self._get_alert_list()
 
-        self.all_dsc_status = []
+class BackupStatusIndex:
+
+    def __init__(self, rows=()) -> None:
+        self.by_name = dict()
+        self.by_id = dict()
+        for row in rows:
+            self.add(row)
+
+    def add(self, row: dict):
+        if row.get("name"):
+            self.by_name.setdefault(row["name"].lower(), []).append(row)
+        if row.get("resourceId"):
+            self.by_id.setdefault(row["resourceId"].lower(), []).append(row)
+
+    def vm_backup(self, resource: Resource):
+        # a VM with rows under its own resource id only ever gets one of those,
+        # the name is used when the query returned no row with that id
+        rows = self.by_id.get((resource.Id or "").lower())
+        if rows is None:
+            rows = self.by_name.get(resource.Name.lower(), ())
+        for row in rows:
+            if row.get("backupItemid") == "iaasresourcecontainerv2" or row.get("isBackedUp"):
+                return row
+        return None
+
+    def sql_vm_backup(self, resource: Resource):
+        # SQL VM resource ids never match the compute VM rows, join on name
+        rows = self.by_name.get(resource.Name.lower())
+        return rows[0] if rows else None
+
+
+class DSCStatusIndex:
+
+    def __init__(self) -> None:
+        self.by_name = dict()
+
+    def add(self, name: str, status: str):
+        # a Compliant node wins, otherwise the last node seen does
+        name = name.lower()
+        if self.by_name.get(name) != 'Compliant':
+            self.by_name[name] = status
+
+    def status(self, name: str):
+        return self.by_name.get(name.lower())
+
+    def __len__(self):
+        return len(self.by_name)
 
-        combined_dict = self._update_resource_alert(combined_dict)
-        self.all_resource_list = [
-            Resource(**resource) for resource in combined_dict.resources]
+
+class ResourceSummarizer:
+
+    def __init__(self, combined_dict: JsonCombiner, graph_page_size: int = 1000,
+                 enricher: VMEnricher = None, batched_enrichment: bool = True,
+                 alert_workers: int = 8, fetch: bool = True) -> None:
+        self.combined_dict = combined_dict
+        self.subscriptions_list = combined_dict.subscriptions
+
+        self.enricher = enricher or VMEnricher()
+
+        # every Azure call goes over REST with tokens from the shared provider.
+        # The ARM pool needs a connection for every thread that can use it at
+        # once: the Windows and Linux enrichment run side by side in the
+        # pipeline, and the alert listing overlaps the DSC listing
+        self.graph_client = ResourceGraphClient(page_size=graph_page_size)
+        self.arm_client = ArmClient(max_workers=max(
+            2 * self.enricher.max_workers, alert_workers + len(_automation_accounts)))
+        self.subscription_ids = dict()
+        self.graph_subscriptions = None
+
+        self.alert_index = AlertScopeIndex()
+        self.alert_errors = dict()
+        self.alert_workers = alert_workers
+
+        self.dsc_index = DSCStatusIndex()
+        self.dsc_errors = dict()
+        self._dsc_loaded = False
+        self.batched_enrichment = batched_enrichment
+        self._vm_details = None
+        self._dcr_associations = None
+
+        self.all_resource_list = []
 
         self.windows_vms: List(VMResource) = []
         self.linux_vms: List(VMResource) = []
@@ -75,110 +225,151 @@ class ResourceSummarizer:
         self.sql_mi = []
         self.aks = []
         self.azure_sql = []
-
-        self.backup_query_exit, self.backup_status = self._get_backup_status()
-
-    def _update_resource_alert(self, combined_dict: JsonCombiner):
-        for resource in combined_dict.resources:
-            resource["alerts"] = []
-            for alert in self.alerts_list:
-                for scope in alert["scopes"]:
-                    if resource["Name"] == scope.split('/')[-1]:
-                        resource["alerts"].append(alert)
+        self.storage_accounts = []
+        self.key_vaults = []
+        self.app_services = []
+        self.other = []
+
+        self.backup_index = BackupStatusIndex()
+
+        # with fetch=False the caller runs these itself, pipeline.py runs
+        # the independent ones side by side
+        if fetch:
+            self.fetch_subscription_ids()
+            self.fetch_alerts()
+            self.load_resources()
+            self.fetch_backup_status()
+
+    def fetch_subscription_ids(self):
+        self.subscription_ids = self.graph_client.subscription_ids(
+            self.subscriptions_list)
+        unresolved = sorted(set(self.subscriptions_list) - set(self.subscription_ids)
+                            - set(self.subscription_ids.values()))
+        if unresolved:
+            # scoping to the ones we found would silently drop the others' VMs
+            logger.warning(f"Could not resolve subscriptions {unresolved}, "
+                           "Resource Graph queries run unscoped")
+            self.graph_subscriptions = None
+        else:
+            self.graph_subscriptions = list(self.subscription_ids.values())
+
+    def fetch_alerts(self):
+        self._get_alert_list(max_workers=self.alert_workers)
+
+    def load_resources(self):
+        # alerts have to be in the index before resources are matched against it
+        self.all_resource_list = [
+            Resource(**resource) for resource in self._update_resource_alert(self.combined_dict.iter_resources())]
+        # a preloaded combiner would otherwise keep every record alive a second
+        # time as a dict for the rest of the run
+        self.combined_dict.resources = []
+
+    def fetch_backup_status(self):
+        self.backup_index = BackupStatusIndex(self._get_backup_status())
+
+    def fetch_dsc_status(self):
+        if not self._dsc_loaded:
+            self._get_dsc_status()
+            self._dsc_loaded = True
+
+    def fetch_vm_details(self):
+        # only the batched enrichment path reads these, both are cached once fetched
+        if self.batched_enrichment:
+            self._get_vm_details()
+            self._get_dcr_associations()
+
+    def _update_resource_alert(self, resources):
+        for resource in resources:
+            with timer("alerts.match"):
+                resource["alerts"] = self.alert_index.match(resource)
             resource["alerts_count"] = len(resource["alerts"])
-        return combined_dict
+            yield resource
+
+    def _subscription_id(self, subscription: str) -> str:
+        return self.subscription_ids.get(subscription, subscription)
 
     def _get_dsc_status(self):
-        exit_code, result_dict, logs = az(
-            f'account get-access-token --tenant {os.getenv("TENANT_ID")}')
-
-        for subscriptionId, auto_accounts in automation_account_map.items():
-            for rg, accounts in auto_accounts.items():
-                for account in accounts:
-                    with requests.Session() as s:
-                        r = s.get(f"https://management.azure.com/subscriptions/{subscriptionId}/resourceGroups/{rg}/providers/Microsoft.Automation/automationAccounts/{account}/nodes?&$top=2000&api-version=2019-06-01", headers={
-                            f"Authorization": f"Bearer {result_dict['accessToken']}"})
-
-                        self.all_dsc_status.extend(r.json()["value"])
-                        while r.json().get("nextLink"):
-                            r = s.get(r.json().get("nextLink"), headers={
-                                f"Authorization": f"Bearer {result_dict['accessToken']}"})
-                            self.all_dsc_status.extend(r.json()["value"])
+        # results are read in account order, so later nodes still override earlier ones
+        with ThreadPoolExecutor(max_workers=len(_automation_accounts)) as executor:
+            futures = [executor.submit(self._get_dsc_nodes, automation_account)
+                       for automation_account in _automation_accounts]
+            for automation_account, future in zip(_automation_accounts, futures):
+                # an account we cannot read leaves its VMs without a DSC status,
+                # it does not stop the report
+                try:
+                    nodes = future.result()
+                except Exception as e:
+                    logger.error(
+                        f"Failed to list DSC nodes in {automation_account[2]}: {e}")
+                    self.dsc_errors[automation_account] = str(e)
+                    continue
+                for name, status in nodes:
+                    self.dsc_index.add(name, status)
+
+    def _get_dsc_nodes(self, automation_account: tuple) -> list:
+        subscriptionId, rg, account = automation_account
+        nodes = self.arm_client.get_paged(
+            f"/subscriptions/{subscriptionId}/resourceGroups/{rg}/providers/Microsoft.Automation/automationAccounts/{account}/nodes",
+            params={"$top": 2000, "api-version": "2019-06-01"})
+        return [(node["name"], node["properties"]["status"]) for node in nodes]
 
     def categorize_resources(self):
+        # one pass to group by type, then each handler gets its whole batch
+        by_type = dict()
         for resource in self.all_resource_list:
-            if resource.Type == "Microsoft.Compute/virtualMachines":
-                for backup_query_item in self.backup_status["data"]:
-                    if resource.Name == backup_query_item.get("name") and (backup_query_item.get("backupItemid") == "iaasresourcecontainerv2" or backup_query_item.get("isBackedUp")):
-                        if backup_query_item["osType"].lower() == "windows":
-                            self.windows_vms.append(VMResource(Name=resource.Name, Location=resource.Location,
-                                                               Id=resource.Id,
-                                                               alerts=resource.alerts, alerts_count=resource.alerts_count,
-                                                               Type=resource.Type, Repo=resource.Repo, ResourceGroup=resource.ResourceGroup,
-                                                               Subscription=resource.Subscription, osType=backup_query_item[
-                                                                   "osType"],
-                                                               osName=backup_query_item[
-                                                                   "osName"], osVersion=backup_query_item["osVersion"],
-                                                               isBackedUp=backup_query_item[
-                                                                   "isBackedUp"], lastbackup=backup_query_item["lastbackup"],
-                                                               lastBackup_status=backup_query_item["lastBackup_status"],
-                                                               lastRecoveryPoint=backup_query_item["lastRecoveryPoint"],
-                                                               protection_status=backup_query_item["protection_status"],
-                                                               policy_name=backup_query_item["policy_name"],
-                                                               backupItemid=backup_query_item["backupItemid"],
-                                                               PowerStatus=backup_query_item["PowerStatus"],
-                                                               offer=backup_query_item[
-                                                                   "offer"], publisher=backup_query_item["publisher"],
-                                                               sku=backup_query_item["sku_2"],
-                                                               RSV=backup_query_item["backupItemid"].split("/")[4]))
-                            break
-                        elif backup_query_item["osType"].lower() == "linux":
-                            self.linux_vms.append(VMResource(Name=resource.Name, Location=resource.Location,
-                                                             Id=resource.Id,
-                                                             alerts=resource.alerts, alerts_count=resource.alerts_count,
-                                                             Type=resource.Type, Repo=resource.Repo, ResourceGroup=resource.ResourceGroup,
-                                                             Subscription=resource.Subscription, osType=backup_query_item[
-                                                                 "osType"],
-                                                             osName=backup_query_item[
-                                                                 "osName"], osVersion=backup_query_item["osVersion"],
-                                                             isBackedUp=backup_query_item[
-                                                                 "isBackedUp"], lastbackup=backup_query_item["lastbackup"],
-                                                             lastBackup_status=backup_query_item["lastBackup_status"],
-                                                             lastRecoveryPoint=backup_query_item["lastRecoveryPoint"],
-                                                             protection_status=backup_query_item["protection_status"],
-                                                             policy_name=backup_query_item["policy_name"],
-                                                             backupItemid=backup_query_item["backupItemid"],
-                                                             PowerStatus=backup_query_item["PowerStatus"],
-                                                             offer=backup_query_item["offer"], publisher=backup_query_item["publisher"],
-                                                             sku=backup_query_item["sku_2"],
-                                                             RSV=backup_query_item["backupItemid"].split("/")[4]))
-                            break
-                        else:
-                            raise VirutalMachineOSTypeError(
-                                backup_query_item["osType"])
-            elif resource.Type == "Microsoft.SqlVirtualMachine/SqlVirtualMachines":
-                for backup_query_item in self.backup_status["data"]:
-                    if resource.Name == backup_query_item.get("name"):
-
-                        self.sql_vms.append(SQLVMResource(Location=resource.Location, Name=resource.Name,
-                                                          Repo=resource.Repo, Type=resource.Type, ResourceGroup=resource.ResourceGroup,
-                                                          Subscription=resource.Subscription, Id=resource.Id, alerts=resource.alerts,
-                                                          alerts_count=resource.alerts_count, policy_name=backup_query_item[
-                                                              "policy_name"],
-                                                          protection_status=backup_query_item["protection_status"],
-                                                          lastbackup=backup_query_item["lastbackup"],
-                                                          lastBackup_status=backup_query_item["lastBackup_status"],
-                                                          RSV=backup_query_item["backupItemid"].split(
-                                                              '/')[4],
-                                                          isBackedUp=backup_query_item["isBackedUp"],
-                                                          vmSize=backup_query_item.get("properties").get("hardwareProfile").get('vmSize')))
-                        break
-            elif resource.Type == "Microsoft.Sql/managedInstances":
-                self.sql_mi.append(resource)
-            elif resource.Type == "Microsoft.Sql/servers":
-                self.azure_sql.append(resource)
-            elif resource.Type == "Microsoft.ContainerService/managedClusters":
-                self.aks.append(resource)
+            batch = by_type.get(resource.Type)
+            if batch is None:
+                batch = by_type[resource.Type] = []
+            batch.append(resource)
+
+        for resource_type, resources in by_type.items():
+            handler = self.resource_handlers.get(resource_type.lower())
+            if handler is None:
+                self.other.extend(resources)
+            else:
+                handler(self, resources)
+
+    def _categorize_vms(self, resources: list):
+        vms_by_os = {"windows": self.windows_vms, "linux": self.linux_vms}
+        for resource in resources:
+            backup_query_item = self.backup_index.vm_backup(resource)
+            if backup_query_item is None:
+                continue
+            vms = vms_by_os.get(backup_query_item["osType"].lower())
+            if vms is None:
+                raise VirutalMachineOSTypeError(backup_query_item["osType"])
+            vms.append(self._vm_resource(resource, backup_query_item))
+
+    def _categorize_sql_vms(self, resources: list):
+        for resource in resources:
+            backup_query_item = self.backup_index.sql_vm_backup(resource)
+            if backup_query_item is None:
+                continue
+            self.sql_vms.append(SQLVMResource(
+                **_resource_fields(resource),
+                **{name: backup_query_item[name] for name in _sql_vm_backup_fields},
+                RSV=backup_query_item["backupItemid"].split("/")[4],
+                vmSize=backup_query_item.get("properties").get("hardwareProfile").get("vmSize")))
+
+    # lower-cased ARM type -> handler(summarizer, resources), anything not listed
+    # ends up in self.other; subclasses can extend this with their own types
+    resource_handlers = {
+        "microsoft.compute/virtualmachines": _categorize_vms,
+        "microsoft.sqlvirtualmachine/sqlvirtualmachines": _categorize_sql_vms,
+        "microsoft.sql/managedinstances": _collect_into("sql_mi"),
+        "microsoft.sql/servers": _collect_into("azure_sql"),
+        "microsoft.containerservice/managedclusters": _collect_into("aks"),
+        "microsoft.storage/storageaccounts": _collect_into("storage_accounts"),
+        "microsoft.keyvault/vaults": _collect_into("key_vaults"),
+        "microsoft.web/sites": _collect_into("app_services"),
+    }
+
+    @staticmethod
+    def _vm_resource(resource: Resource, backup_query_item: dict) -> VMResource:
+        return VMResource(**_resource_fields(resource),
+                          **{name: backup_query_item[name] for name in _vm_backup_fields},
+                          sku=backup_query_item["sku_2"],
+                          RSV=backup_query_item["backupItemid"].split("/")[4])
 
     def _get_backup_status(self):
 
@@ -209,16 +400,61 @@ class ResourceSummarizer:
 // | project tenantId,location, env_tag, app_tag, description_tag,AssetName_tag, resourceId,name, type, subscriptionId, resourceGroup, isBackedUp, backupItemid, sku_2, publisher, offer, osType, osVersion, osName, PowerStatus, policy_name, lastBackup_status, protection_status, lastbackup, lastRecoveryPoint
                 """
 
-        exit_code, result_dict, logs = az(
-            f"graph query -q '{query}' --first 1000")
-        print(logs)
-        return exit_code, result_dict
-
-    def _get_alert_list(self):
-        for subscription in self.subscriptions_list:
-            exit_code, result_dict, logs = az(
-                f"monitor metrics alert list --subscription {subscription}")
-            self.alerts_list.extend(result_dict)
+        # rows are streamed page by page, scoped to the subscriptions in the inventory
+        # when every one of them resolved
+        return self.graph_client.query(query, subscriptions=self.graph_subscriptions)
+
+    def _get_vm_details(self) -> dict:
+        if self._vm_details is None:
+            query = """
+                Resources | where type =~ "microsoft.compute/virtualmachines"
+                | project id = tolower(id), vmSize = tostring(properties.hardwareProfile.vmSize)
+                | join kind = leftouter ( Resources
+                | where type =~ "microsoft.compute/virtualmachines/extensions"
+                | extend lid = tolower(id)
+                | project vmId = substring(lid, 0, indexof(lid, "/extensions/")), extension = pack("name", name, "provisioningState", tostring(properties.provisioningState))
+                | summarize extensions = make_list(extension) by vmId ) on $left.id == $right.vmId
+                | project id, vmSize, extensions
+                """
+            self._vm_details = {row["id"]: row for row in self.graph_client.query(
+                query, subscriptions=self.graph_subscriptions)}
+        return self._vm_details
+
+    def _get_dcr_associations(self) -> dict:
+        if self._dcr_associations is None:
+            query = """
+                InsightsResources | where type =~ "microsoft.insights/datacollectionruleassociations"
+                | extend lid = tolower(id)
+                | project vmId = substring(lid, 0, indexof(lid, "/providers/microsoft.insights/datacollectionruleassociations/")), dataCollectionRuleId = tostring(properties.dataCollectionRuleId)
+                """
+            self._dcr_associations = dict()
+            for row in self.graph_client.query(query, subscriptions=self.graph_subscriptions):
+                self._dcr_associations.setdefault(
+                    row["vmId"], []).append(row)
+        return self._dcr_associations
+
+    def _get_alert_list(self, max_workers: int = 8):
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            futures = {executor.submit(self._get_subscription_alerts, subscription, provider, api_version): subscription
+                       for subscription in self.subscriptions_list
+                       for provider, api_version in alert_rule_providers.items()}
+            # the index is only touched from this thread
+            for future in as_completed(futures):
+                subscription = futures[future]
+                try:
+                    for alert in future.result():
+                        self.alert_index.add(alert)
+                except Exception as e:
+                    logger.error(
+                        f"Failed to list alerts in {subscription}: {e}")
+                    self.alert_errors.setdefault(
+                        subscription, []).append(str(e))
+
+    def _get_subscription_alerts(self, subscription: str, provider: str, api_version: str) -> list:
+        alerts = self.arm_client.get_paged(
+            f"/subscriptions/{self._subscription_id(subscription)}/providers/{provider}",
+            params={"api-version": api_version})
+        return [flatten_properties(alert) for alert in alerts]
 
     def check_windows_vms(self):
         logger.info(line)
@@ -227,22 +463,11 @@ class ResourceSummarizer:
             logger.info("No windows VMs in the listed resource groups")
             return
 
-        self._get_dsc_status()
+        self.fetch_dsc_status()
+        self._enrich_vms(self.windows_vms, linux=False)
         for vm in self.windows_vms:
-            logger.info(f"Processsing {vm.Name}")
-            exit_code, result_dict, logs = az(
-                f"vm show -n '{vm.Name}' -g {vm.ResourceGroup} --subscription {vm.Subscription}")
-
-            vm.Size = result_dict.get("hardwareProfile").get("vmSize")
-            vm.extentions = result_dict.get("resources")
-            vm.dsc_status = None
-            vm.dsc_compliant = None
-            for dsc_node in self.all_dsc_status:
-                if dsc_node["name"].lower() == vm.Name.lower():
-                    vm.dsc_status = dsc_node["properties"]['status']
-                    vm.dsc_compliant = dsc_node["properties"]['status'] == 'Compliant'
-                    if vm.dsc_compliant:
-                        break
+            vm.dsc_status = self.dsc_index.status(vm.Name)
+            vm.dsc_compliant = None if vm.dsc_status is None else vm.dsc_status == 'Compliant'
 
     def check_linux_vms(self):
 
@@ -252,66 +477,98 @@ class ResourceSummarizer:
             logger.info("No Linux VMs in the listed resource groups")
             return
 
-        for vm in self.linux_vms:
-            logger.info(f"Processing {vm.Name}")
-            exit_code, result_dict, logs = az(
-                f"vm show -n '{vm.Name}' -g {vm.ResourceGroup} --subscription {vm.Subscription}")
-
-            vm.Size = result_dict.get("hardwareProfile").get("vmSize")
-            vm.extentions = result_dict.get("resources")
-            # dcr linux_to_sec
-            vm.dcr_sec = None
-            # dcr linux_to_shd
-            vm.dcr_shd = None
-
-            exit_code, result_dict, logs = az(
-                f"monitor data-collection rule association list --resource {vm.Id}")
-
-            if not result_dict:
-                return
-            for dcr in result_dict:
-                if not dcr.get("dataCollectionRuleId"):
-                    continue
-                if dcr.get("dataCollectionRuleId").split('/')[-1].lower() == 'linux-to-sec':
-                    vm.dcr_sec = True
-                elif dcr.get("dataCollectionRuleId").split('/')[-1].lower() == 'linux-to-shd':
-                    vm.dcr_shd = True
-                else:
-                    logger.warn(
-                        f"{vm.Name} not connected to either 'linux-to-sec` or 'linux-to-shd'.")
+        self._enrich_vms(self.linux_vms, linux=True)
 
-    # def check_sql_vms(self):
+    def _enrich_vms(self, vms: list, linux: bool):
+        enrich = self._enrich_linux_vm if linux else self._enrich_vm
+        if not self.batched_enrichment:
+            self.enricher.run(vms, enrich)
+            return
 
-    def output_xlsx(self):
-        name_dict = dict()
-        type_dict = dict()
-        location_dict = dict()
-        rg_dict = dict()
-        subscription_dict = dict()
-        repo_tag_dict = dict()
+        vm_details = self._get_vm_details()
+        dcr_associations = self._get_dcr_associations() if linux else {}
+        fallback = []
+        for vm in vms:
+            details = vm_details.get((vm.Id or "").lower())
+            if not details or not details.get("vmSize"):
+                # Graph has no record of it, take the per-VM path
+                fallback.append(vm)
+                continue
+            vm.Size = details["vmSize"]
+            vm.extentions = details.get("extensions") or []
+            if linux:
+                self._apply_dcr_associations(
+                    vm, dcr_associations.get((vm.Id or "").lower()))
+        if fallback:
+            logger.info(
+                f"{len(fallback)} VMs not returned by Resource Graph, querying them one by one")
+            self.enricher.run(fallback, enrich)
+
+    def _enrich_vm(self, vm: VMResource):
+        logger.info(f"Processing {vm.Name}")
+        result_dict = flatten_properties(self.arm_client.get(
+            f"/subscriptions/{self._subscription_id(vm.Subscription)}/resourceGroups/{vm.ResourceGroup}/providers/Microsoft.Compute/virtualMachines/{vm.Name}",
+            params={"api-version": "2023-03-01"}))
+
+        vm.Size = result_dict.get("hardwareProfile").get("vmSize")
+        vm.extentions = [flatten_properties(extension)
+                         for extension in result_dict.get("resources") or []]
+
+    def _enrich_linux_vm(self, vm: VMResource):
+        self._enrich_vm(vm)
+        associations = self.arm_client.get_paged(
+            f"{vm.Id}/providers/Microsoft.Insights/dataCollectionRuleAssociations",
+            params={"api-version": "2022-06-01"})
+        self._apply_dcr_associations(
+            vm, [flatten_properties(dcr) for dcr in associations])
+
+    def _apply_dcr_associations(self, vm: VMResource, associations: list):
+        # dcr linux_to_sec
+        vm.dcr_sec = None
+        # dcr linux_to_shd
+        vm.dcr_shd = None
+
+        if not associations:
+            return
+        for dcr in associations:
+            if not dcr.get("dataCollectionRuleId"):
+                continue
+            if dcr.get("dataCollectionRuleId").split('/')[-1].lower() == 'linux-to-sec':
+                vm.dcr_sec = True
+            elif dcr.get("dataCollectionRuleId").split('/')[-1].lower() == 'linux-to-shd':
+                vm.dcr_shd = True
+            else:
+                logger.warning(
+                    f"{vm.Name} not connected to either 'linux-to-sec` or 'linux-to-shd'.")
 
-        count = 0
+    # def check_sql_vms(self):
+
+    resource_columns = ["NAME", "TYPE", "LOCATION",
+                        "SUBSCRIPTION", "RESOURCEGROUP", "REPO(TAG)"]
 
+    def resource_rows(self):
         for resource in self.all_resource_list:
-            name_dict[count] = resource.Name
-            type_dict[count] = resource.Type
-            location_dict[count] = resource.Location
-            rg_dict[count] = resource.ResourceGroup
-            subscription_dict[count] = resource.Subscription
-            repo_tag_dict[count] = resource.Repo
-
-            count += 1
-
-        df = pd.DataFrame({"NAME": name_dict,
-                           "TYPE": type_dict,
-                          "LOCATION": location_dict,
-                           "SUBSCRIPTION": subscription_dict,
-                           "RESOURCEGROUP": rg_dict,
-                           "REPO(TAG)": repo_tag_dict})
+            yield (resource.Name, resource.Type, resource.Location,
+                   resource.Subscription, resource.ResourceGroup, resource.Repo)
+
+    def resource_frame(self) -> pd.DataFrame:
+        return pd.DataFrame.from_records(self.resource_rows(), columns=self.resource_columns).astype(
+            {"TYPE": "category", "LOCATION": "category", "SUBSCRIPTION": "category", "RESOURCEGROUP": "category"})
+
+    def output_xlsx(self):
+        df = self.resource_frame()
 
         print(df)
 
         # writer = pd.ExcelWriter(
         #     "files/resource_summary.xlsx", engine='xlsxwriter')
         # df.to_excel(writer, sheet_name="resourcelist", index=False)
-        df.to_csv("files/resource_summary.csv", encoding='utf-8', index=False)
+        with timer("output.csv"):
+            df.to_csv("files/resource_summary.csv",
+                      encoding='utf-8', index=False)
+
+    def output(self, backend: str = "csv", path: str = "files/resource", chunk_size: int = 10_000):
+        with timer(f"output.{backend}"), get_backend(backend, path, chunk_size=chunk_size) as writer:
+            count = writer.write_table("summary", self.resource_columns, self.resource_rows(),
+                                       categories=("TYPE", "LOCATION", "SUBSCRIPTION", "RESOURCEGROUP"))
+        print(f"Wrote {count} resources to {path} as {backend}")
@@ -1,23 +1,155 @@
-from data_model import VMResource, Resource
+import pandas as pd
+
+from data_model import Resource
 from summary_base import ResourceSummarizer
+from report_output import get_backend
+from instrumentation import timer
 from logger import get_logger, line
 
 line2 = "****************************************************"
 logger = get_logger(name=__name__)
 
+# ResourceSummarizer list -> category label, in report order
+categories = {
+    "windows_vms": "windows_vm",
+    "linux_vms": "linux_vm",
+    "sql_vms": "sql_vm",
+    "sql_mi": "sql_mi",
+    "azure_sql": "azure_sql",
+    "aks": "aks",
+    "storage_accounts": "storage_account",
+    "key_vaults": "key_vault",
+    "app_services": "app_service",
+}
+
+# checks that only apply to some categories, the rest get NA
+backup_categories = ("windows_vm", "linux_vm", "sql_vm")
+alert_categories = ("windows_vm", "linux_vm", "sql_vm")
+extension_categories = ("windows_vm", "linux_vm")
+
 
 class SummaryReporter:
 
+    compliance_columns = ["Category", "Name", "Type", "Subscription", "ResourceGroup", "Location",
+                          "PowerStatus", "osName", "Size", "policy_name", "RSV", "lastBackup_status",
+                          "isBackedUp", "protection_status", "alerts_count", "dsc_status",
+                          "dsc_compliant", "dcr_sec", "dcr_shd", "extensions", "extensions_failed"]
+    check_columns = ["alert_ok", "backup_ok",
+                     "dsc_ok", "dcr_ok", "extensions_ok"]
+
     def __init__(self, rs: ResourceSummarizer) -> None:
         self.rs = rs
+        self._frame = None
+
+    @staticmethod
+    def _compliance_row(category: str, resource: Resource) -> tuple:
+        extensions = getattr(resource, "extentions", None)
+        return (category, resource.Name, resource.Type, resource.Subscription, resource.ResourceGroup,
+                resource.Location, getattr(resource, "PowerStatus", None), getattr(
+                    resource, "osName", None),
+                getattr(resource, "Size", None) or getattr(
+                    resource, "vmSize", None),
+                getattr(resource, "policy_name", None), getattr(
+                    resource, "RSV", None),
+                getattr(resource, "lastBackup_status", None), getattr(
+                    resource, "isBackedUp", None),
+                getattr(resource, "protection_status", None), resource.alerts_count,
+                getattr(resource, "dsc_status", None), getattr(
+                    resource, "dsc_compliant", None),
+                getattr(resource, "dcr_sec", None), getattr(
+                    resource, "dcr_shd", None),
+                "; ".join(f'{extension["name"]}: {extension["provisioningState"]}'
+                          for extension in extensions) if extensions else None,
+                # None when the VM could not be enriched, an empty list is a VM without any
+                sum(extension["provisioningState"] != "Succeeded"
+                    for extension in extensions) if extensions is not None else None)
+
+    def compliance_rows(self):
+        for attribute, category in categories.items():
+            for resource in getattr(self.rs, attribute):
+                yield self._compliance_row(category, resource)
+
+    def compliance_frame(self) -> pd.DataFrame:
+        if self._frame is not None:
+            return self._frame
+
+        with timer("compliance.frame"):
+            frame = pd.DataFrame.from_records(
+                self.compliance_rows(), columns=self.compliance_columns)
+            category = frame["Category"]
+
+            # the old log check was `Subscription != ("AU-SHARED-001" or "AU-PROD-001")`,
+            # which only ever compared against AU-SHARED-001; kept as it behaved
+            frame["alert_ok"] = ((frame["alerts_count"] > 0) | (
+                frame["Subscription"] != "AU-SHARED-001")).astype("boolean").where(category.isin(alert_categories))
+
+            # VM rows carry a bool, SQL VM rows a number
+            backed_up = pd.to_numeric(frame["isBackedUp"], errors="coerce")
+            frame["isBackedUp"] = (backed_up > 0).astype(
+                "boolean").where(backed_up.notna())
+            frame["backup_ok"] = frame["isBackedUp"].fillna(
+                False).where(category.isin(backup_categories))
+            # a Windows VM no automation account knows about is not compliant
+            frame["dsc_ok"] = frame["dsc_compliant"].fillna(False).astype(bool).astype(
+                "boolean").where(category == "windows_vm")
+            frame["dcr_ok"] = (frame["dcr_sec"].fillna(False).astype(bool) | frame["dcr_shd"].fillna(False).astype(bool)).astype(
+                "boolean").where(category == "linux_vm")
+            frame["extensions_failed"] = frame["extensions_failed"].astype("Int64")
+            # a VM whose extensions could not be read does not pass
+            frame["extensions_ok"] = (frame["extensions_failed"] == 0).fillna(False).astype(
+                "boolean").where(category.isin(extension_categories))
+
+            # checks that do not apply to a category count as passed
+            frame["compliant"] = frame[self.check_columns].fillna(
+                True).all(axis=1)
+            frame = frame.astype({"Category": "category", "Type": "category", "Subscription": "category",
+                                  "ResourceGroup": "category", "Location": "category"})
+        self._frame = frame
+        return frame
+
+    def summary_frame(self) -> pd.DataFrame:
+        frame = self.compliance_frame()
+        failed = ~frame[self.check_columns].fillna(True)
+        failed.columns = [column.replace("_ok", "_failed")
+                          for column in self.check_columns]
+        failed["Category"] = frame["Category"]
+        summary = failed.groupby("Category", observed=True).sum()
+        summary.insert(0, "compliant", frame.groupby(
+            "Category", observed=True)["compliant"].sum())
+        summary.insert(0, "total", frame.groupby(
+            "Category", observed=True).size())
+        summary.loc["all"] = summary.sum()
+        return summary.reset_index()
+
+    @staticmethod
+    def _rows(frame: pd.DataFrame):
+        # NA/NaN cells go to the backends as None
+        return frame.astype(object).where(frame.notna(), None).itertuples(index=False)
+
+    def output(self, backend: str = "csv", path: str = "files/compliance", chunk_size: int = 10_000):
+        frame = self.compliance_frame()
+        summary = self.summary_frame()
+        with timer(f"output.{backend}"), get_backend(backend, path, chunk_size=chunk_size) as writer:
+            count = writer.write_table("compliance", list(frame.columns), self._rows(frame),
+                                       categories=("Category", "Type", "Subscription", "ResourceGroup", "Location"))
+            writer.write_table("summary", list(summary.columns),
+                               self._rows(summary))
+        print(summary.to_string(index=False))
+        print(f"Wrote {count} resources to {path} as {backend}")
+
+    # the per-resource log report, rendered from the compliance table
+
+    def _category_rows(self, category: str):
+        frame = self.compliance_frame()
+        return self._rows(frame[frame["Category"] == category])
 
     def report_vm_list(self):
         logger.info(line)
         logger.info("Printing VMs name list")
         logger.info(line)
-        for vm in self.rs.windows_vms:
+        for vm in self._category_rows("windows_vm"):
             logger.info(f"{vm.Name}")
-        for vm in self.rs.linux_vms:
+        for vm in self._category_rows("linux_vm"):
             logger.info(f"{vm.Name}")
 
     def report_windows_vms(self):
@@ -27,7 +159,7 @@ class SummaryReporter:
         logger.info("Reporting windows VMs to log file")
         logger.info(line)
 
-        for vm in self.rs.windows_vms:
+        for vm in self._category_rows("windows_vm"):
             self._report_vm_general(vm=vm)
 
             logger.info(f'DSC Status: {vm.dsc_status}')
@@ -40,7 +172,7 @@ class SummaryReporter:
         logger.info("Reporting Linux VMs to log file")
         logger.info(line)
 
-        for vm in self.rs.linux_vms:
+        for vm in self._category_rows("linux_vm"):
             self._report_vm_general(vm=vm)
 
             logger.info(f'DCR linux-to-sec: {vm.dcr_sec}')
@@ -53,24 +185,14 @@ class SummaryReporter:
         logger.info("Reporting SQL VMs to log file")
         logger.info(line)
 
-        for vm in self.rs.sql_vms:
+        for vm in self._category_rows("sql_vm"):
             logger.info(line2)
             logger.info(f"Name: {vm.Name}")
-            logger.info(f"vmSize: {vm.vmSize}")
+            logger.info(f"vmSize: {vm.Size}")
             logger.info(f'Resrouce Group: {vm.ResourceGroup}')
             logger.info(f'Subscription: {vm.Subscription}')
 
-            logger.info(f'Backup:')
-            logger.info(f'      Backup Policy: {vm.policy_name}')
-            logger.info(f"      RSV: {vm.RSV}")
-            logger.info(f'      lastBackupStatus: {vm.lastBackup_status}')
-            logger.info(
-                f'      isBackedup: {"Yes" if vm.isBackedUp > 0 else "No"}')
-            logger.info(f'      Protection Status: {vm.protection_status}')
-
-            logger.info(
-                f'Alert Setup: {"Ok" if vm.alerts_count > 0 or (vm.Subscription != ("AU-SHARED-001" or "AU-PROD-001")) else "No good"}')
-            logger.info(f'Alerts count: {vm.alerts_count}')
+            self._report_backup(vm)
 
     def report_azure_sql(self):
         if len(self.rs.azure_sql) < 1:
@@ -78,7 +200,7 @@ class SummaryReporter:
         logger.info(line)
         logger.info("Reporting Azure SQL to log file")
         logger.info(line)
-        for azure_sql in self.rs.azure_sql:
+        for azure_sql in self._category_rows("azure_sql"):
             self._report_resource_general(resource=azure_sql)
 
     def report_sql_mi(self):
@@ -87,7 +209,7 @@ class SummaryReporter:
         logger.info(line)
         logger.info("Reporting SQL MI to log file")
         logger.info(line)
-        for sql_mi in self.rs.sql_mi:
+        for sql_mi in self._category_rows("sql_mi"):
             self._report_resource_general(resource=sql_mi)
 
     def report_aks(self):
@@ -96,7 +218,7 @@ class SummaryReporter:
         logger.info(line)
         logger.info("Reporting AKS to log file")
         logger.info(line)
-        for aks in self.rs.aks:
+        for aks in self._category_rows("aks"):
             self._report_resource_general(resource=aks)
 
     def report(self):
@@ -108,32 +230,37 @@ class SummaryReporter:
         self.report_azure_sql()
         self.report_aks()
 
-    def _report_resource_general(self, resource: Resource):
+    def _report_resource_general(self, resource):
         logger.info(line2)
         logger.info(f"Name: {resource.Name}")
         logger.info(f'Resrouce Group: {resource.ResourceGroup}')
         logger.info(f'Subscription: {resource.Subscription}')
         logger.info(f'Type: {resource.Type}')
 
-    def _report_vm_general(self, vm: VMResource):
-        logger.info(line2)
-        self._report_resource_general(resource=vm)
-
-        logger.info(f"Power Status: {vm.PowerStatus}")
-        logger.info(f'OS: {vm.osName}')
+    def _report_backup(self, vm):
         logger.info(f'Backup:')
         logger.info(f'      Backup Policy: {vm.policy_name}')
         logger.info(f"      RSV: {vm.RSV}")
         logger.info(f'      lastBackupStatus: {vm.lastBackup_status}')
         logger.info(
-            f'      isBackedup: {"Yes" if vm.isBackedUp > 0 else "No"}')
+            f'      isBackedup: {"Yes" if vm.backup_ok else "No"}')
         logger.info(f'      Protection Status: {vm.protection_status}')
 
         logger.info(
-            f'Alert Setup: {"Ok" if vm.alerts_count > 0 or (vm.Subscription != ("AU-SHARED-001" or "AU-PROD-001")) else "No good"}')
+            f'Alert Setup: {"Ok" if vm.alert_ok else "No good"}')
         logger.info(f'Alerts count: {vm.alerts_count}')
 
+    def _report_vm_general(self, vm):
+        logger.info(line2)
+        self._report_resource_general(resource=vm)
+
+        logger.info(f"Power Status: {vm.PowerStatus}")
+        logger.info(f'OS: {vm.osName}')
+        self._report_backup(vm)
+
         logger.info("Extensions:")
-        for extension in vm.extentions:
-            logger.info(
-                f'   {extension["name"]}: {extension["provisioningState"]}')
+        if vm.extensions:
+            for extension in vm.extensions.split("; "):
+                logger.info(f'   {extension}')
+        elif vm.extensions_failed is None:
+            logger.info('   Could not be read')
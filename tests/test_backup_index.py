@@ -0,0 +1,143 @@
+import json
+import os
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_model import Resource  # noqa: E402
+from summary_base import BackupStatusIndex, ResourceSummarizer  # noqa: E402
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__),
+                       "fixtures", "backup_status.json")
+
+
+@pytest.fixture
+def fixture():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+def _summarizer(fixture) -> ResourceSummarizer:
+    # categorisation only, nothing is fetched
+    rs = ResourceSummarizer.__new__(ResourceSummarizer)
+    rs.all_resource_list = [Resource(**resource)
+                            for resource in fixture["resources"]]
+    rs.backup_index = BackupStatusIndex(fixture["backup_rows"])
+    for attribute in ("windows_vms", "linux_vms", "sql_vms", "sql_mi", "azure_sql", "aks",
+                      "storage_accounts", "key_vaults", "app_services", "other"):
+        setattr(rs, attribute, [])
+    rs.categorize_resources()
+    return rs
+
+
+def _old_join(fixture) -> dict:
+    # the scan categorize_resources did before the index: first row with the
+    # exact same name that is iaasresourcecontainerv2 or backed up
+    selected = {"windows_vms": [], "linux_vms": [], "sql_vms": []}
+    for resource in fixture["resources"]:
+        if resource["Type"] == "Microsoft.Compute/virtualMachines":
+            for row in fixture["backup_rows"]:
+                if resource["Name"] == row.get("name") and (row.get("backupItemid") == "iaasresourcecontainerv2" or row.get("isBackedUp")):
+                    target = "windows_vms" if row["osType"].lower() == "windows" else "linux_vms"
+                    selected[target].append((resource["Id"], row["backupItemid"]))
+                    break
+        elif resource["Type"] == "Microsoft.SqlVirtualMachine/SqlVirtualMachines":
+            for row in fixture["backup_rows"]:
+                if resource["Name"] == row.get("name"):
+                    selected["sql_vms"].append((resource["Id"], row["backupItemid"]))
+                    break
+    return selected
+
+
+def _selected(vms: list) -> list:
+    return [(vm.Id, vm.backupItemid) for vm in vms]
+
+
+def test_matches_old_join_where_names_are_unambiguous(fixture):
+    rs = _summarizer(fixture)
+    old = _old_join(fixture)
+    # the deliberate differences are covered by the tests below
+    changed = {resource["Id"] for resource in fixture["resources"]
+               if resource["Name"] in ("dup-vm", "dup-half", "Win-Case-01")}
+
+    for attribute in ("windows_vms", "linux_vms"):
+        new = [item for item in _selected(getattr(rs, attribute))
+               if item[0] not in changed]
+        assert new == [item for item in old[attribute] if item[0] not in changed]
+
+    # SQL VM rows carry the compute VM's backup item, RSV is its vault resource group
+    assert [vm.Id for vm in rs.sql_vms] == [item[0] for item in old["sql_vms"]]
+    assert [vm.RSV for vm in rs.sql_vms] == [item[1].split("/")[4]
+                                             for item in old["sql_vms"]]
+
+
+def test_windows_linux_split_and_skips(fixture):
+    rs = _summarizer(fixture)
+    assert [vm.Name for vm in rs.windows_vms] == [
+        "win-app-01", "dup-vm", "Win-Case-01", "dup-half"]
+    assert [vm.Name for vm in rs.linux_vms] == [
+        "lnx-web-01", "lnx-db-01", "dup-vm"]
+    assert [vm.Name for vm in rs.sql_vms] == ["sql-01"]
+    # no backed-up row, or no row at all: not reported as a VM
+    names = {vm.Name for vm in rs.windows_vms + rs.linux_vms}
+    assert "vm-no-backup" not in names
+    assert "vm-not-in-graph" not in names
+
+
+def test_backed_up_row_preferred_over_earlier_row(fixture):
+    rs = _summarizer(fixture)
+    lnx_db = next(vm for vm in rs.linux_vms if vm.Name == "lnx-db-01")
+    assert lnx_db.isBackedUp is True
+    assert lnx_db.RSV == "rg-db"
+
+
+def test_same_name_in_two_resource_groups_joins_on_resource_id(fixture):
+    # the old join gave both VMs the first dup-vm row (rg-a, Linux);
+    # the index joins each one on its own resourceId first
+    old = _old_join(fixture)
+    assert [item for item in old["linux_vms"] if "/dup-vm" in item[0]] == [
+        (resource["Id"], fixture["backup_rows"][5]["backupItemid"])
+        for resource in fixture["resources"] if resource["Name"] == "dup-vm"]
+
+    rs = _summarizer(fixture)
+    dup = {vm.ResourceGroup: vm for vm in rs.windows_vms +
+           rs.linux_vms if vm.Name == "dup-vm"}
+    assert dup["rg-a"].osType == "Linux"
+    assert dup["rg-a"].RSV == "rg-a"
+    assert dup["rg-b"].osType == "Windows"
+    assert dup["rg-b"].RSV == "rg-b"
+
+
+def test_own_unprotected_row_is_not_replaced_by_same_named_vm(fixture):
+    # rg-a's dup-half row is not backed up, rg-b's is: the old join gave the
+    # rg-a VM rg-b's Windows row, the index keeps it to its own rows
+    old = _old_join(fixture)
+    rg_b_item = next(row["backupItemid"] for row in fixture["backup_rows"]
+                     if row["name"] == "dup-half" and row["resourceGroup"] == "rg-b")
+    assert [item[1] for item in old["windows_vms"] if "/dup-half" in item[0]] == [
+        rg_b_item, rg_b_item]
+
+    rs = _summarizer(fixture)
+    dup = [vm for vm in rs.windows_vms + rs.linux_vms if vm.Name == "dup-half"]
+    assert [(vm.ResourceGroup, vm.osType, vm.RSV) for vm in dup] == [
+        ("rg-b", "Windows", "rg-b")]
+
+
+def test_name_fallback_is_case_insensitive(fixture):
+    # the old join compared names exactly and dropped Win-Case-01
+    assert all("Win-Case-01" not in item[0]
+               for items in _old_join(fixture).values() for item in items)
+    rs = _summarizer(fixture)
+    assert "Win-Case-01" in [vm.Name for vm in rs.windows_vms]
+
+
+def test_iaasresourcecontainerv2_row_is_selected():
+    row = {"name": "vm-1", "backupItemid": "iaasresourcecontainerv2",
+           "isBackedUp": False, "osType": "Windows"}
+    index = BackupStatusIndex([{"name": "vm-1", "backupItemid": None, "isBackedUp": False}, row])
+    resource = Resource(Location="l", Name="vm-1", Repo=None, Type="Microsoft.Compute/virtualMachines",
+                        ResourceGroup="rg", Subscription="s", Id="/x/vm-1")
+    assert index.vm_backup(resource) is row
@@ -0,0 +1,48 @@
+import os
+import sys
+from types import SimpleNamespace
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from data_model import Resource, VMResource  # noqa: E402
+from summary_reporter import SummaryReporter, categories  # noqa: E402
+
+
+_backup_row = dict.fromkeys(("osName", "osVersion", "lastbackup", "lastBackup_status", "lastRecoveryPoint",
+                             "protection_status", "policy_name", "backupItemid", "PowerStatus", "offer",
+                             "publisher", "sku", "RSV"))
+
+
+def _vm(name: str, extentions, subscription: str = "AU-SHARED-001") -> VMResource:
+    return VMResource(Location="australiaeast", Name=name, Repo=None, Type="Microsoft.Compute/virtualMachines",
+                      ResourceGroup="rg", Subscription=subscription, Id=f"/x/{name}", alerts_count=1,
+                      osType="Windows", isBackedUp=True, extentions=extentions, **_backup_row)
+
+
+def _reporter(**lists) -> SummaryReporter:
+    rs = SimpleNamespace(**{attribute: [] for attribute in categories})
+    for attribute, resources in lists.items():
+        setattr(rs, attribute, resources)
+    return SummaryReporter(rs)
+
+
+def test_vm_that_could_not_be_enriched_fails_the_extension_check():
+    ok = [{"name": "a", "provisioningState": "Succeeded"}]
+    failed = [{"name": "a", "provisioningState": "Failed"}]
+    frame = _reporter(windows_vms=[_vm("ok", ok), _vm("none-installed", []), _vm("failed", failed),
+                                   _vm("not-enriched", None)]).compliance_frame()
+    assert frame.set_index("Name")["extensions_ok"].to_dict() == {
+        "ok": True, "none-installed": True, "failed": False, "not-enriched": False}
+    assert frame["extensions_failed"].isna().tolist() == [False, False, False, True]
+
+
+def test_alert_check_only_applies_to_vms():
+    storage = Resource(Location="australiaeast", Name="st", Repo=None, Type="Microsoft.Storage/storageAccounts",
+                       ResourceGroup="rg", Subscription="AU-SHARED-001", Id="/x/st", alerts_count=0)
+    vm = _vm("vm", [])
+    vm.alerts_count = 0
+    frame = _reporter(windows_vms=[vm], storage_accounts=[storage]).compliance_frame()
+    alert_ok = frame.set_index("Name")["alert_ok"]
+    assert not alert_ok["vm"]
+    assert alert_ok.isna()["st"]
+    assert frame.set_index("Name")["compliant"]["st"]
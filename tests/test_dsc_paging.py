@@ -0,0 +1,62 @@
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "scripts"))
+
+from azure_client import ArmClient  # noqa: E402
+from azure_stub_server import AzureStubHandler, make_dsc_nodes  # noqa: E402
+from summary_base import DSCStatusIndex, ResourceSummarizer  # noqa: E402
+
+
+class StaticTokens:
+
+    def get_token(self, tenant=None, resource=None) -> str:
+        return "token"
+
+
+class CountingHandler(AzureStubHandler):
+
+    requests = 0
+
+    def do_GET(self):
+        CountingHandler.requests += 1
+        super().do_GET()
+
+
+@pytest.fixture
+def stub():
+    CountingHandler.dsc_nodes = make_dsc_nodes(4500)
+    CountingHandler.requests = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), CountingHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def test_dsc_nodes_are_read_over_every_page(stub):
+    rs = ResourceSummarizer.__new__(ResourceSummarizer)
+    rs.arm_client = ArmClient(tokens=StaticTokens(), endpoint=stub)
+    nodes = rs._get_dsc_nodes(("sub", "rg", "account"))
+
+    # 2000 per page, so three requests
+    assert CountingHandler.requests == 3
+    assert nodes == [(node["name"], node["properties"]["status"])
+                     for node in CountingHandler.dsc_nodes]
+
+
+def test_repeated_and_differently_cased_names_share_one_status():
+    nodes = make_dsc_nodes(4500)
+    index = DSCStatusIndex()
+    for node in nodes:
+        index.add(node["name"], node["properties"]["status"])
+    assert len(index) == 4050
+    compliant = {node["name"].lower() for node in nodes
+                 if node["properties"]["status"] == "Compliant"}
+    assert all(index.status(name.upper()) == "Compliant" for name in compliant)
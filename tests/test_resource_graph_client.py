@@ -0,0 +1,109 @@
+import json
+import os
+import sys
+import threading
+from http.server import ThreadingHTTPServer
+
+import pytest
+
+root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+sys.path.insert(0, root)
+sys.path.insert(0, os.path.join(root, "scripts"))
+
+from azure_client import ResourceGraphClient, ThrottledError  # noqa: E402
+from azure_stub_server import AzureStubHandler  # noqa: E402
+from summary_base import ResourceSummarizer  # noqa: E402
+
+
+FIXTURE = os.path.join(os.path.dirname(__file__), "fixtures", "graph_rows.json")
+
+
+class StaticTokens:
+
+    def get_token(self, tenant=None, resource=None) -> str:
+        return "token"
+
+
+@pytest.fixture
+def rows():
+    with open(FIXTURE) as f:
+        return json.load(f)
+
+
+@pytest.fixture
+def stub(rows):
+    AzureStubHandler.graph_rows = rows
+    AzureStubHandler.throttle = 0
+    AzureStubHandler.retry_after = 0
+    server = ThreadingHTTPServer(("127.0.0.1", 0), AzureStubHandler)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield f"http://127.0.0.1:{server.server_address[1]}"
+    server.shutdown()
+    server.server_close()
+
+
+def _client(endpoint: str, **kwargs) -> ResourceGraphClient:
+    # small pages and batches so a handful of rows covers several of each
+    kwargs.setdefault("page_size", 4)
+    return ResourceGraphClient(tokens=StaticTokens(), endpoint=endpoint, batch_size=5,
+                               backoff=0.01, **kwargs)
+
+
+def test_unscoped_query_follows_skip_tokens(stub, rows):
+    pages = list(_client(stub).pages("Resources"))
+    assert len(pages) == 12
+    assert [row for page in pages for row in page] == rows
+
+
+def test_scoped_query_over_several_batches(stub, rows):
+    subscriptions = sorted({row["subscriptionId"] for row in rows})
+    # 12 subscriptions in batches of 5, three batches paging side by side
+    got = list(_client(stub).query("Resources", subscriptions))
+    assert sorted(row["id"] for row in got) == sorted(row["id"] for row in rows)
+
+    some = subscriptions[::2]
+    got = list(_client(stub).query("Resources", some))
+    assert sorted(row["id"] for row in got) == sorted(
+        row["id"] for row in rows if row["subscriptionId"] in some)
+
+
+def test_closing_the_generator_early_stops_the_batches(stub, rows):
+    subscriptions = sorted({row["subscriptionId"] for row in rows})
+    before = threading.active_count()
+    query = _client(stub, page_size=1).query("Resources", subscriptions)
+    first = [next(query) for _ in range(3)]
+    query.close()
+    assert all(row in rows for row in first)
+    # the pool is shut down by close(), its workers are gone
+    assert threading.active_count() == before
+
+
+def test_throttled_pages_are_retried(stub, rows):
+    AzureStubHandler.throttle = 3
+    got = list(_client(stub).query("Resources"))
+    assert got == rows
+    assert AzureStubHandler.throttle == 0
+
+
+def test_throttling_past_the_retries_raises(stub):
+    AzureStubHandler.throttle = 10
+    with pytest.raises(ThrottledError):
+        list(_client(stub, retries=2).query("Resources"))
+
+
+def test_subscription_ids_drops_unknown_names(stub, rows):
+    ids = _client(stub).subscription_ids(["sub-00", "sub-01", "zz"])
+    assert ids == {"sub-00": "sub-00", "sub-01": "sub-01"}
+
+
+def test_unresolved_subscription_leaves_queries_unscoped(stub):
+    rs = ResourceSummarizer.__new__(ResourceSummarizer)
+    rs.graph_client = _client(stub)
+    rs.subscriptions_list = {"sub-00", "sub-01"}
+    rs.fetch_subscription_ids()
+    assert sorted(rs.graph_subscriptions) == ["sub-00", "sub-01"]
+
+    rs.subscriptions_list = {"sub-00", "zz"}
+    rs.fetch_subscription_ids()
+    assert rs.graph_subscriptions is None
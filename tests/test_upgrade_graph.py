@@ -0,0 +1,44 @@
+import os
+import sys
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+from upgrade_graph import UpgradeGraph  # noqa: E402
+
+
+def _graph() -> UpgradeGraph:
+    # shaped like az aks get-versions: the newest GA release lists a preview upgrade
+    return UpgradeGraph({"orchestrators": [
+        {"orchestratorVersion": "1.26.6",
+         "upgrades": [{"orchestratorVersion": "1.26.10"}, {"orchestratorVersion": "1.27.3"}]},
+        {"orchestratorVersion": "1.26.10",
+         "upgrades": [{"orchestratorVersion": "1.27.3"}]},
+        {"orchestratorVersion": "1.27.3",
+         "upgrades": [{"orchestratorVersion": "1.28.0", "isPreview": True}]},
+        {"orchestratorVersion": "1.28.0", "isPreview": True, "upgrades": None},
+    ]})
+
+
+def test_newest_ga_with_only_a_preview_upgrade_is_latest():
+    graph = _graph()
+    assert graph.is_latest("1.27.3", False)
+    assert not graph.is_latest("1.27.3", False, include_preview=True)
+    assert not graph.is_latest("1.26.10", False)
+
+
+def test_unlisted_version_is_not_latest():
+    assert not _graph().is_latest("1.27.1", False)
+
+
+def test_latest_patch_stays_on_the_minor():
+    graph = _graph()
+    assert graph.latest_patch("1.26.6", False) == (["1.26.10"], "1.26.10")
+    assert graph.latest_patch("1.26.10", False) == ([], "1.26.10")
+
+
+def test_latest_patch_from_unlisted_version():
+    graph = _graph()
+    # 1.26.8 is not listed, the next listed version is a patch of the same minor
+    assert graph.latest_patch("1.26.8", False) == (["1.26.10"], "1.26.10")
+    # 1.26.12 is not listed and the next listed version is 1.27.3, a minor upgrade
+    assert graph.latest_patch("1.26.12", False) == ([], "1.26.12")
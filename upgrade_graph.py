@@ -0,0 +1,132 @@
+import re
+from collections import deque
+
+
+_version_pattern = re.compile(r"^v?(\d+)(?:\.(\d+))?(?:\.(\d+))?(.*)$")
+
+
+def parse_version(version: str) -> tuple:
+    # "1.27.3" -> (1, 27, 3, 1, ""), "1.28.0-preview" -> (1, 28, 0, 0, "preview"),
+    # so a release sorts after its own pre-releases
+    match = _version_pattern.match(version.strip())
+    if not match:
+        return (0, 0, 0, 0, version)
+    major, minor, patch, suffix = match.groups()
+    suffix = suffix.lstrip("-+.")
+    return (int(major), int(minor or 0), int(patch or 0), 0 if suffix else 1, suffix)
+
+
+class UpgradeGraph:
+
+    def __init__(self, upgrades: dict) -> None:
+        self.keys = dict()
+        self.adjacency = dict()
+        self.preview = set()
+
+        for orchestrator in upgrades["orchestrators"]:
+            version = orchestrator["orchestratorVersion"]
+            self.keys[version] = parse_version(version)
+            if orchestrator.get("isPreview"):
+                self.preview.add(version)
+            targets = self.adjacency.setdefault(version, [])
+            for upgrade in orchestrator.get("upgrades") or []:
+                self.keys.setdefault(upgrade["orchestratorVersion"], parse_version(
+                    upgrade["orchestratorVersion"]))
+                if upgrade.get("isPreview"):
+                    self.preview.add(upgrade["orchestratorVersion"])
+                targets.append(upgrade["orchestratorVersion"])
+
+        for targets in self.adjacency.values():
+            targets.sort(key=self.keys.get)
+        self.versions = sorted(self.adjacency, key=self.keys.get)
+
+    def key(self, version: str) -> tuple:
+        return self.keys.get(version) or parse_version(version)
+
+    def is_outdated(self, version: str) -> bool:
+        return self.key(version) < self.keys[self.versions[0]]
+
+    def _targets(self, version: str, include_preview: bool) -> list:
+        targets = self.adjacency.get(version, [])
+        if include_preview:
+            return targets
+        return [target for target in targets if target not in self.preview]
+
+    def _start(self, version: str, is_outdated: bool):
+        # versions below the oldest supported one have to move onto it first,
+        # versions the region does not list move to the next one it does
+        if is_outdated:
+            return self.versions[0], [self.versions[0]]
+        if version in self.adjacency:
+            return version, []
+        for node in self.versions:
+            if self.key(version) < self.keys[node]:
+                return node, [node]
+        return version, []
+
+    def is_latest(self, version: str, is_outdated: bool, include_preview: bool = False) -> bool:
+        # latest means there is nowhere to go: not moved onto a listed version first,
+        # and no upgrade target from the one it is on. The newest GA release nearly
+        # always lists a preview upgrade, so those only count when asked for
+        start, path = self._start(version, is_outdated)
+        return not path and not self._targets(start, include_preview)
+
+    def aggressive(self, version: str, is_outdated: bool, include_preview: bool = True):
+        path = []
+        if is_outdated:
+            version = self.versions[0]
+            path.append(version)
+        for node in self.versions:
+            if self.key(version) < self.keys[node]:
+                version = node
+                path.append(version)
+            if version == node:
+                targets = self._targets(node, include_preview)
+                if not targets:
+                    break
+                version = targets[-1]
+                path.append(version)
+        return path, version
+
+    def minimal_hops(self, version: str, is_outdated: bool, include_preview: bool = True):
+        start, path = self._start(version, is_outdated)
+        parents = {start: None}
+        queue = deque([start])
+        while queue:
+            node = queue.popleft()
+            for target in reversed(self._targets(node, include_preview)):
+                if target not in parents:
+                    parents[target] = node
+                    queue.append(target)
+
+        # breadth first, so the walk back from the highest version is the shortest
+        target = max(parents, key=self.key)
+        hops = []
+        while target != start:
+            hops.append(target)
+            target = parents[target]
+        path.extend(reversed(hops))
+        return path, path[-1] if path else version
+
+    def latest_patch(self, version: str, is_outdated: bool, include_preview: bool = True):
+        start, path = self._start(version, is_outdated)
+        if path and not is_outdated and self.keys[start][:2] != self.key(version)[:2]:
+            # an unlisted version with no later listed patch of its own minor stays put
+            return [], version
+        patches = [target for target in self._targets(start, include_preview)
+                   if self.keys[target][:2] == self.key(start)[:2]]
+        if patches:
+            path.append(patches[-1])
+        return path, path[-1] if path else version
+
+
+# one compiled graph per region document, shared by every cluster in the region
+_compiled_graphs = dict()
+
+
+def compile_upgrade_graph(upgrades: dict) -> UpgradeGraph:
+    compiled = _compiled_graphs.get(id(upgrades))
+    if compiled is None or compiled[0] is not upgrades:
+        compiled = (upgrades, UpgradeGraph(upgrades))
+        _compiled_graphs[id(upgrades)] = compiled
+    return compiled[1]